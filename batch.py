@@ -0,0 +1,107 @@
+import datetime
+
+import numpy as np
+
+from classes import (ensure_tables, evaluate, RANK_ENCODED_ARRAY, STRENGTH, WHEEL_MASK, ROYAL_FLUSH, STRAIGHT_FLUSH,
+                     FOUR_OF_A_KIND, FULL_HOUSE, FLUSH, STRAIGHT, THREE, TWO_PAIR, PAIR, HIGH, WIN_NAMES)
+
+# same strengths & encoding as the evaluator in classes, so ranks out of here are the same ints evaluate gives
+STRENGTHS = np.array(STRENGTH, dtype=np.int64)
+STRENGTH_BITS = 1 << np.arange(13, dtype=np.int64)
+ENCODED = RANK_ENCODED_ARRAY  # sorted, so position in it is the dense rank. filled in once the tables are loaded
+HIGHEST = np.array([-1] + [mask.bit_length() - 1 for mask in range(1, 1 << 13)], dtype=np.int64)  # -1 for no bits
+
+def best5_batch(cards, chunk_size=4096):
+    """takes in an (N, 5-7) array of card indices (card.index), gives (rank, category) arrays of length N, with the
+    same ranks as evaluate & categories from HIGH to ROYAL_FLUSH. works through chunk_size rows at a time"""
+    ensure_tables()
+    cards = np.asarray(cards, dtype=np.int64)
+    if cards.ndim != 2 or not 5 <= cards.shape[1] <= 7:
+        raise ValueError(f'cards has to be an (N, 5-7) array, not {cards.shape}')
+    ranks = np.empty(len(cards), dtype=np.int64)
+    for start in range(0, len(cards), chunk_size):
+        ranks[start:start + chunk_size] = _rank_chunk(cards[start:start + chunk_size])
+    return ranks, ENCODED[ranks] >> 20
+
+def cards_array(card_lists):
+    """turns equal length lists of cards (e.g. hand + table for each row) into an array for best5_batch"""
+    return np.array([[card.index for card in cards] for cards in card_lists], dtype=np.int64)
+
+def _rank_chunk(cards):
+    n_rows = len(cards)
+    strengths = STRENGTHS[cards]
+    suits = cards // 13
+    rows = np.arange(n_rows)[:, None]
+
+    # rank counting: how many of each strength, then a mask of the strengths appearing 1, 2, 3 & 4 times
+    counts = np.bincount((rows * 13 + strengths).ravel(), minlength=13 * n_rows).reshape(n_rows, 13)
+    present = (counts > 0) @ STRENGTH_BITS
+    pairs = (counts == 2) @ STRENGTH_BITS
+    trips = (counts == 3) @ STRENGTH_BITS
+    quads = (counts == 4) @ STRENGTH_BITS
+
+    # flush detection: strengths of the most common suit (at most one suit can have 5 of 7)
+    suit_counts = np.bincount((rows * 4 + suits).ravel(), minlength=4 * n_rows).reshape(n_rows, 4)
+    is_flush = suit_counts.max(axis=1) >= 5
+    flush_suit = suit_counts.argmax(axis=1)
+    flush_mask = ((suits == flush_suit[:, None]) << strengths).sum(axis=1)
+
+    # kicker selection: highest strengths left once the defining ones are taken out
+    top_pair, top_trip, top_quad = HIGHEST[pairs], HIGHEST[trips], HIGHEST[quads]
+    second_pair = HIGHEST[pairs & ~(1 << top_pair)]
+    full_house_pair = HIGHEST[trips & ~(1 << top_trip) | pairs]
+
+    # goes from worst to best category, so each better one overwrites
+    encoded = _encode(HIGH, *_top_strengths(present, 5))
+    encoded = np.where(pairs > 0, _encode(PAIR, top_pair, *_top_strengths(present & ~(1 << top_pair), 3)), encoded)
+    two_pair_kicker = HIGHEST[present & ~(1 << top_pair) & ~(1 << second_pair)]
+    encoded = np.where(second_pair >= 0, _encode(TWO_PAIR, top_pair, second_pair, two_pair_kicker), encoded)
+    encoded = np.where(trips > 0, _encode(THREE, top_trip, *_top_strengths(present & ~(1 << top_trip), 2)), encoded)
+    straight_top = _straight_top(present)
+    encoded = np.where(straight_top >= 0, _encode(STRAIGHT, straight_top), encoded)
+    encoded = np.where(is_flush, _encode(FLUSH, *_top_strengths(flush_mask, 5)), encoded)
+    encoded = np.where((trips > 0) & (full_house_pair >= 0), _encode(FULL_HOUSE, top_trip, full_house_pair), encoded)
+    encoded = np.where(quads > 0, _encode(FOUR_OF_A_KIND, top_quad, HIGHEST[present & ~(1 << top_quad)]), encoded)
+    flush_straight_top = np.where(is_flush, _straight_top(flush_mask), -1)
+    encoded = np.where(flush_straight_top >= 0, _encode(STRAIGHT_FLUSH, flush_straight_top), encoded)
+    encoded = np.where(flush_straight_top == 12, _encode(ROYAL_FLUSH, flush_straight_top), encoded)
+    return np.searchsorted(ENCODED, encoded)
+
+def _encode(category, *strengths):
+    """array version of classes._encode"""
+    encoded = category << 20
+    for i, strength in enumerate(strengths):
+        encoded = encoded | strength << (16 - 4 * i)
+    return encoded
+
+def _straight_top(strength_masks):
+    """array version of classes._straight_top, -1 where there's no straight"""
+    top = np.where(strength_masks & WHEEL_MASK == WHEEL_MASK, 3, -1)
+    for straight_top in range(4, 13):
+        top = np.where(strength_masks >> (straight_top - 4) & 31 == 31, straight_top, top)
+    return top
+
+def _top_strengths(strength_masks, n):
+    """the n highest strengths in each mask, highest first"""
+    top = []
+    for _ in range(n):
+        top.append(HIGHEST[strength_masks])
+        strength_masks = strength_masks & ~(1 << top[-1])
+    return top
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    print()
+    rng = np.random.default_rng(0)
+    test_cards = np.argsort(rng.random((1000000, 52)), axis=1)[:, :7]
+
+    start_time = datetime.datetime.now()
+    test_ranks, test_categories = best5_batch(test_cards)
+    end_time = datetime.datetime.now()
+    print(f'Time for {len(test_cards)} hands:  {end_time-start_time}')
+
+    print(f'Same as evaluate?       {all(evaluate(row) == rank for row, rank in zip(test_cards[:20000].tolist(), test_ranks))}')
+    for category in range(HIGH, ROYAL_FLUSH + 1):
+        print(f'{WIN_NAMES[category]:>16}: {(test_categories == category).sum()}')
+    print()
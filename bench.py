@@ -0,0 +1,254 @@
+from itertools import combinations
+import argparse
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+
+from classes import (CARDS, best5, better_hands_after_5, better_hands_after_5_legacy, check_straight_potential,
+                     hands_after_5, evaluate, evaluate_mask, cards_to_mask, is_straight, rank_category, rank_strengths,
+                     WIN_NAMES, ROYAL_FLUSH, STRAIGHT_FLUSH, FOUR_OF_A_KIND, FULL_HOUSE, FLUSH, STRAIGHT, THREE, TWO_PAIR,
+                     PAIR, HIGH)
+from batch import best5_batch
+from handstate import HandState
+from utils import summarise
+
+"""CORPUS"""
+def build_corpus(n_per_category=200, seed=0):
+    """seeded 7 card deals (as card index lists, hand first) with n_per_category of each win type HIGH to ROYAL_FLUSH.
+    straight & royal flushes are too rare to wait for, so they're dealt on purpose, everything's checked by category"""
+    rng = random.Random(seed)
+    corpus = {category: [] for category in range(HIGH, ROYAL_FLUSH + 1)}
+    while any(len(deals) < n_per_category for category, deals in corpus.items() if category < STRAIGHT_FLUSH):
+        deal = rng.sample(range(52), 7)
+        deals = corpus[rank_category(evaluate(deal))]
+        if len(deals) < n_per_category:
+            deals.append(deal)
+    for category in (STRAIGHT_FLUSH, ROYAL_FLUSH):
+        while len(corpus[category]) < n_per_category:
+            deal = _deal_straight_flush(rng, category)
+            if rank_category(evaluate(deal)) == category:
+                corpus[category].append(deal)
+    return corpus
+
+def _deal_straight_flush(rng, category):
+    """a straight flush (ace high for royal) plus 2 random cards, shuffled, as card indices"""
+    suit = rng.randrange(4)
+    top = 13 if category == ROYAL_FLUSH else rng.randrange(4, 13)  # index in suit of the top card, ace as 13
+    straight = [(top - i) % 13 + 13 * suit for i in range(5)]
+    deal = straight + rng.sample([index for index in range(52) if index not in straight], 2)
+    rng.shuffle(deal)
+    return deal
+
+"""TIMING"""
+def time_calls(function, args_list):
+    """calls function(*args) for each args, gives the per call latencies in nanoseconds"""
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter_ns()
+        function(*args)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+def run_benchmarks(corpus, slow_calls=200, batch_size=4096):
+    """times the hot paths over the corpus. slow_calls caps the calls to the slow (better hands) ones"""
+    deals = [deal for category_deals in corpus.values() for deal in category_deals]
+    card_deals = [[CARDS[index] for index in deal] for deal in deals]
+    rng = random.Random(0)
+    slow_deals = rng.sample(card_deals, min(slow_calls, len(card_deals)))
+
+    results = {}
+    results['evaluate'] = summarise(time_calls(evaluate, [(deal,) for deal in deals]))
+    results['evaluate_mask'] = summarise(time_calls(evaluate_mask, [(cards_to_mask(cards),) for cards in card_deals]))
+    results['best5'] = summarise(time_calls(best5, [(cards[:2], cards[2:]) for cards in card_deals]))
+    batches = [(deals[start:start + batch_size],) for start in range(0, len(deals), batch_size)]
+    results['best5_batch'] = summarise(time_calls(best5_batch, batches), n_items=len(deals))
+    numbers = [([card.number for card in cards] + [14] * any(card.number == 1 for card in cards),) for cards in card_deals]
+    results['is_straight'] = summarise(time_calls(is_straight, numbers))
+    results['check_straight_potential'] = summarise(time_calls(check_straight_potential, [(cards[2:],) for cards in card_deals]))
+    results['better_hands_after_5'] = summarise(time_calls(better_hands_after_5, [(cards[:2], cards[2:]) for cards in slow_deals]))
+    results['better_hands_after_5_legacy'] = summarise(time_calls(better_hands_after_5_legacy,
+                                                                  [(cards[:2], cards[2:]) for cards in slow_deals]))
+    return results
+
+"""ORACLE"""
+def reference_score(cards):
+    """deliberately simple reference: best of all 5 card subsets, each scored straight from the rules.
+    gives (win type, the 5 numbers with ace as 14 in order of importance)"""
+    return max(_reference_score_5(five) for five in combinations(cards, 5))
+
+def _reference_score_5(cards):
+    values = sorted([14 if card.number == 1 else card.number for card in cards], reverse=True)
+    flush = len({card.suit for card in cards}) == 1
+    straight_top = None
+    if len(set(values)) == 5 and values[0] - values[4] == 4:
+        straight_top = values[0]
+    elif values == [14, 5, 4, 3, 2]:
+        straight_top = 5
+    # numbers by how often they appear, then how high
+    groups = sorted(((values.count(value), value) for value in set(values)), reverse=True)
+    counts = [count for count, value in groups]
+    by_group = [value for count, value in groups for _ in range(count)]
+    if straight_top and flush:
+        straight = [straight_top - i for i in range(4)] + [straight_top - 4 if straight_top > 5 else 14]
+        return (ROYAL_FLUSH if straight_top == 14 else STRAIGHT_FLUSH, straight)
+    if counts[0] == 4:
+        return (FOUR_OF_A_KIND, by_group)
+    if counts == [3, 2]:
+        return (FULL_HOUSE, by_group)
+    if flush:
+        return (FLUSH, values)
+    if straight_top:
+        return (STRAIGHT, [straight_top - i for i in range(4)] + [straight_top - 4 if straight_top > 5 else 14])
+    if counts[0] == 3:
+        return (THREE, by_group)
+    if counts[0] == 2:
+        return (TWO_PAIR if counts[1] == 2 else PAIR, by_group)
+    return (HIGH, values)
+
+def engine_score(rank):
+    """an evaluator rank in the same form as reference_score"""
+    return (rank_category(rank), [strength + 2 for strength in rank_strengths(rank)])
+
+def oracle_check(n_samples=100000, seed=1, batch_size=4096):
+    """checks evaluate, evaluate_mask, best5 & best5_batch against reference_score on seeded random 7 card deals
+    (5, 6 & 7 cards), and that evaluate orders consecutive deals the same way the reference does"""
+    rng = random.Random(seed)
+    deals = [rng.sample(range(52), rng.choice((5, 6, 7, 7, 7, 7))) for _ in range(n_samples)]
+    mismatches = []
+    batch_ranks = {}
+    for n_cards in (5, 6, 7):
+        rows = [i for i, deal in enumerate(deals) if len(deal) == n_cards]
+        if rows:
+            ranks = best5_batch([deals[i] for i in rows], batch_size)[0]
+            batch_ranks.update(zip(rows, ranks.tolist()))
+    previous = None
+    for i, deal in enumerate(deals):
+        cards = [CARDS[index] for index in deal]
+        rank = evaluate(deal)
+        reference = reference_score(cards)
+        engine_ok = engine_score(rank) == reference and evaluate_mask(cards_to_mask(cards)) == rank and \
+            batch_ranks[i] == rank and (len(cards) < 7 or best5(cards[:2], cards[2:]).rank == rank)
+        if previous is not None:
+            engine_ok &= (rank > previous[0]) - (rank < previous[0]) == (reference > previous[1]) - (reference < previous[1])
+        if not engine_ok:
+            mismatches.append(deal)
+        previous = (rank, reference)
+    return {'samples': n_samples, 'seed': seed, 'mismatches': len(mismatches), 'first_mismatches': mismatches[:10]}
+
+def hands_after_5_check(n_deals=20, seed=2):
+    """checks hands_after_5 on seeded random deals against brute force: every one of the 990 opponent holdings scored
+    with reference_score & compared to yours. a deal with any holding in the wrong set counts as a mismatch"""
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(n_deals):
+        deal = rng.sample(range(52), 7)
+        cards = [CARDS[index] for index in deal]
+        your_score = reference_score(cards)
+        expected = (set(), set(), set())  # better, tied, worse, as combo slots
+        for second in range(52):
+            for first in range(second):
+                if first not in deal and second not in deal:
+                    score = reference_score([CARDS[first], CARDS[second]] + cards[2:])
+                    outcome = 0 if score > your_score else 1 if score == your_score else 2
+                    expected[outcome].add(second * (second - 1) // 2 + first)
+        if hands_after_5(cards[:2], cards[2:]) != expected:
+            mismatches.append(deal)
+    return {'deals': n_deals, 'seed': seed, 'mismatches': len(mismatches), 'first_mismatches': mismatches[:10]}
+
+def handstate_check(n_samples=10000, seed=3):
+    """checks HandState.rank & category against reference_score on seeded random deals, as cards are added one at a
+    time (at 5, 6 & 7 cards, where there are no outs left) and after one's taken back out again"""
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(n_samples):
+        deal = rng.sample(range(52), 7)
+        cards = [CARDS[index] for index in deal]
+        state = HandState(cards[:4])
+        for n_cards in (5, 6, 7):
+            state.add(cards[n_cards - 1])
+            engine_ok = engine_score(state.rank()) == reference_score(cards[:n_cards]) and \
+                state.category() == reference_score(cards[:n_cards])[0] and (n_cards < 7 or state.outs() == {})
+            if not engine_ok:
+                break
+        else:
+            removed = cards.pop(rng.randrange(7))
+            state.remove(removed)
+            engine_ok = engine_score(state.rank()) == reference_score(cards)
+        if not engine_ok:
+            mismatches.append(deal)
+    return {'samples': n_samples, 'seed': seed, 'mismatches': len(mismatches), 'first_mismatches': mismatches[:10]}
+
+def exhaustive_5_check():
+    """checks evaluate against reference_score on every one of the 2,598,960 5 card hands (slow)"""
+    mismatches = 0
+    for deal in combinations(range(52), 5):
+        if engine_score(evaluate(deal)) != _reference_score_5([CARDS[index] for index in deal]):
+            mismatches += 1
+    return {'hands': 2598960, 'mismatches': mismatches}
+
+"""REPORTING"""
+def compare_results(results, previous, tolerance=0.1):
+    """names whose p50 latency got more than tolerance (fraction) slower than in previous"""
+    regressions = []
+    for name, result in results.items():
+        if name in previous and result['p50_us'] > previous[name]['p50_us'] * (1 + tolerance):
+            regressions.append((name, previous[name]['p50_us'], result['p50_us']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmarks & correctness checks for the evaluator hot paths')
+    parser.add_argument('--per-category', type=int, default=200, help='deals of each win type in the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--slow-calls', type=int, default=200, help='calls to the better hands functions')
+    parser.add_argument('--oracle-samples', type=int, default=100000, help='random deals checked against reference')
+    parser.add_argument('--hands-after-5-deals', type=int, default=20,
+                        help='deals hands_after_5 is checked on against all 990 holdings scored by reference')
+    parser.add_argument('--handstate-samples', type=int, default=10000, help='random deals HandState is checked on')
+    parser.add_argument('--exhaustive-5', action='store_true', help='also check every 5 card hand (slow)')
+    parser.add_argument('--out', help='save results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='p50 slowdown counted as a regression')
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.per_category, args.seed)
+    results = run_benchmarks(corpus, args.slow_calls)
+    print(f'{"":28} {"calls":>7} {"p50 us":>10} {"p90 us":>10} {"p99 us":>10} {"per s":>12}')
+    for name, result in results.items():
+        print(f'{name:28} {result["calls"]:7} {result["p50_us"]:10.2f} {result["p90_us"]:10.2f} '
+              f'{result["p99_us"]:10.2f} {result["throughput_per_s"]:12.0f}')
+
+    oracle = oracle_check(args.oracle_samples, args.seed + 1)
+    print(f'\nOracle mismatches:        {oracle["mismatches"]} of {oracle["samples"]}')
+    oracle['hands_after_5'] = hands_after_5_check(args.hands_after_5_deals, args.seed + 2)
+    print(f'hands_after_5 mismatches: {oracle["hands_after_5"]["mismatches"]} of {oracle["hands_after_5"]["deals"]}')
+    oracle['handstate'] = handstate_check(args.handstate_samples, args.seed + 3)
+    print(f'HandState mismatches:     {oracle["handstate"]["mismatches"]} of {oracle["handstate"]["samples"]}')
+    if args.exhaustive_5:
+        oracle['exhaustive_5'] = exhaustive_5_check()
+        print(f'5 card mismatches:        {oracle["exhaustive_5"]["mismatches"]} of {oracle["exhaustive_5"]["hands"]}')
+
+    report = {'meta': {'date': datetime.datetime.now().isoformat(), 'python': platform.python_version(),
+                       'per_category': args.per_category, 'seed': args.seed,
+                       'corpus_categories': {WIN_NAMES[category]: len(deals) for category, deals in corpus.items()}},
+              'results': results, 'oracle': oracle}
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare_results(results, json.load(file)['results'], args.tolerance)
+        for name, old_p50, new_p50 in regressions:
+            print(f'Regression: {name} p50 {old_p50:.2f} us -> {new_p50:.2f} us')
+    failed = oracle['mismatches'] or oracle['hands_after_5']['mismatches'] or oracle['handstate']['mismatches'] or \
+        oracle.get('exhaustive_5', {}).get('mismatches') or regressions
+    return 1 if failed else 0
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+import datetime
+import threading
+
+from classes import Card, cards_to_mask, hands_after_5, pairs_from_combos, COMBO_PAIRS, HEART, CLUB, SPADE, DIAM
+from equity import equity
+import profiling
+
+def canonicalise(hand, board):
+    """relabels suits so that every (hand, board) that's the same up to suits comes out the same.
+    gives canonical hand, canonical board, key (hashable, same for all of them) & suit_map (suit_map[suit] = new suit)"""
+    hand_mask, board_mask = cards_to_mask(hand), cards_to_mask(board)
+    # a suit is described by which numbers of it are in hand & on board. suits get ordered by that, so suits that
+    # look the same are interchangeable and it doesn't matter which way round they go
+    suit_keys = [(hand_mask >> 13 * suit & 0x1FFF, board_mask >> 13 * suit & 0x1FFF) for suit in range(4)]
+    order = sorted(range(4), key=suit_keys.__getitem__, reverse=True)
+    suit_map = [0] * 4
+    for new_suit, suit in enumerate(order):
+        suit_map[suit] = new_suit
+    canonical_hand = sorted([Card(card.number, suit_map[card.suit]) for card in hand], key=_card_index)
+    canonical_board = sorted([Card(card.number, suit_map[card.suit]) for card in board], key=_card_index)
+    return canonical_hand, canonical_board, tuple(suit_keys[suit] for suit in order), suit_map
+
+def _card_index(card):
+    return card.index
+
+class LRUCache:
+    """bounded, thread safe least recently used cache, counting hits, misses & evictions"""
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.entries),
+                    'maxsize': self.maxsize}
+
+class CanonicalCache:
+    """sits in front of hands_after_5 & equity. works them out on the canonical form of (hand, board), caches
+    that, and maps cards in results back to the caller's suits. given a name, its stats show up in profiling snapshots
+    under it. best5 isn't worth caching: canonicalising the cards costs more than evaluating them"""
+    def __init__(self, maxsize=100000, name=None):
+        self.cache = LRUCache(maxsize)
+        if name is not None:
+            profiling.watch_cache(name, self.cache)
+
+    def _cached(self, name, function, hand, board, extra=()):
+        canonical_hand, canonical_board, key, suit_map = canonicalise(hand, board)
+        key = (name, key, extra)
+        result = self.cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = function(canonical_hand, canonical_board)
+            self.cache.put(key, result)
+        # suit_back[new suit] = caller's suit
+        suit_back = [0] * 4
+        for suit, new_suit in enumerate(suit_map):
+            suit_back[new_suit] = suit
+        return result, suit_back
+
+    def hands_after_5(self, your_hand, table):
+        split, suit_back = self._cached('hands_after_5', hands_after_5, your_hand, table)
+        if suit_back == [0, 1, 2, 3]:
+            return tuple(set(hands) for hands in split)
+        index_back = [index % 13 + 13 * suit_back[index // 13] for index in range(52)]
+        combo_back = [_combo_slot(index_back[first.index], index_back[second.index]) for first, second in COMBO_PAIRS]
+        return tuple({combo_back[combo] for combo in hands} for hands in split)
+
+    def better_hands_after_5(self, your_hand, table):
+        return pairs_from_combos(self.hands_after_5(your_hand, table)[0])
+
+    def equity(self, hand, board, n_opponents=1, **kwargs):
+        """equity doesn't depend on suit labels, so the result comes back as is"""
+        def canonical_equity(canonical_hand, canonical_board):
+            return equity(canonical_hand, canonical_board, n_opponents, **kwargs)
+        extra = (n_opponents, tuple(sorted(kwargs.items())))
+        return self._cached('equity', canonical_equity, hand, board, extra)[0]
+
+    def stats(self):
+        return self.cache.stats()
+
+def _combo_slot(first, second):
+    """combo slot (see classes.COMBO_PAIRS) of 2 card indices, either order"""
+    first, second = sorted((first, second))
+    return second * (second - 1) // 2 + first
+
+_MISSING = object()
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    print()
+    hand_test = [Card(8, SPADE), Card(10, HEART)]
+    table_test = [Card(3, HEART), Card(1, CLUB), Card(11, CLUB), Card(8, CLUB), Card(12, HEART)]
+    # same spot with hearts & spades swapped, and clubs & diamonds swapped
+    swap = {SPADE: HEART, HEART: SPADE, CLUB: DIAM, DIAM: CLUB}
+    hand_swapped = [Card(card.number, swap[card.suit]) for card in hand_test]
+    table_swapped = [Card(card.number, swap[card.suit]) for card in table_test]
+
+    cache = CanonicalCache()
+    for hand, table in ((hand_test, table_test), (hand_swapped, table_swapped)):
+        start_time = datetime.datetime.now()
+        better_hands = cache.better_hands_after_5(hand, table)
+        end_time = datetime.datetime.now()
+        print(f'Time for better hands:    {end_time-start_time}')
+        print(f'Same as uncached?         {better_hands == pairs_from_combos(hands_after_5(hand, table)[0])}')
+    print(f'Cache stats:              {cache.stats()}')
+    print()
@@ -1,5 +1,14 @@
-from itertools import permutations
+from array import array
+from functools import total_ordering
+from itertools import combinations_with_replacement, permutations
+from operator import attrgetter
+from multiprocessing import parent_process, shared_memory
 import datetime
+import time
+
+import numpy as np
+
+import profiling
 
 DIAM, CLUB, HEART, SPADE = 0, 1, 2, 3
 SUIT_NAMES = {DIAM: "diam", CLUB: "club", HEART: "heart", SPADE: "spade"}
@@ -20,9 +29,23 @@ WIN_NAMES = {ROYAL_FLUSH: 'royal flush', STRAIGHT_FLUSH: 'straight flush', FOUR_
 
 
 class Card:
-    def __init__(self, number, suit):
-        self.number = number
-        self.suit = suit
+    """cards are interned, so Card(num, suit) hands back the same object every time"""
+    __slots__ = ('number', 'suit', 'index', 'bit')
+    _interned = {}
+
+    def __new__(cls, number, suit):
+        card = cls._interned.get((number, suit))
+        if card is None:
+            card = super().__new__(cls)
+            card.number = number
+            card.suit = suit
+            card.index = (number - 1) % 13 + 13 * suit  # 0..51, same as hash - 1 (ace as 14 shares ace's index)
+            card.bit = 1 << card.index  # bit of this card in a 52 bit hand/board mask
+            cls._interned[(number, suit)] = card
+        return card
+
+    def __reduce__(self):
+        return Card, (self.number, self.suit)
 
     def __str__(self):
         return f'{self.number} {SUIT_NAMES[self.suit]}'
@@ -36,103 +59,373 @@ class Card:
     def give_number(self):
         return self.number
 
+_card_number = attrgetter('number')  # same as Card.give_number, without a Python level call per card
+
+@total_ordering
 class Quintet:
-    def __init__(self, type_of_win, list_of_cards, defining_num):
+    """orders by rank, so equal Quintets are an exact tie (kickers included) and the bigger one wins"""
+    def __init__(self, type_of_win, list_of_cards, defining_num, rank=None):
         self.type = type_of_win
-        list_of_cards.sort(key=Card.give_number)
+        list_of_cards.sort(key=_card_number)
         self.cards = list_of_cards
         self.defining_num = defining_num
+        # integer strength from evaluate, bigger is better. worked out from the cards if it isn't given
+        self.rank = evaluate([card.index for card in list_of_cards]) if rank is None else rank
 
     def __str__(self):
         return f'{WIN_NAMES[self.type]} \n{[str(card) for card in self.cards]} with {self.defining_num} being defining.'
 
+    def __eq__(self, other):
+        if not isinstance(other, Quintet):
+            return NotImplemented
+        return self.rank == other.rank
+
+    def __lt__(self, other):
+        if not isinstance(other, Quintet):
+            return NotImplemented
+        return self.rank < other.rank
+
+    def __hash__(self):
+        return hash(self.rank)
+
 FULL_SET = [Card(num, suit) for num in range(1, 14) for suit in range(4)]
 SUIT_COMBOS = list(permutations([0, 1, 2, 3], 2))
+CARDS = [Card(index % 13 + 1, index // 13) for index in range(52)]  # CARDS[card.index] is card
+FULL_MASK = (1 << 52) - 1
 
-def best5(hand, table):
-    """takes in 5 on table and 2 in hand, returns Quintet of win type & 5 best cards"""
-    cards = hand + table
-    aces = []
+"""CARD MASKS"""
+def cards_to_mask(cards):
+    """turns a list of cards into a 52 bit mask, one bit per card index"""
+    mask = 0
     for card in cards:
-        if card.number == 1:
-            aces.append(Card(14, card.suit))
-    cards += aces
-    suits = [card.suit for card in cards]
-    numbers = [card.number for card in cards]
-
-    # checks for flush and flush variants (royal, straight flushes)
-    for flush_suit in range(4):
-        if sum([suits[i] == flush_suit for i in range(7)]) >= 5:
-            flushed_numbers = sorted([numbers[i] for i, suit in enumerate(suits) if suit == flush_suit])
-            straighted, best_5_num = is_straight(flushed_numbers)
-            if straighted:
-                best_5 = [Card(number, flush_suit) for number in best_5_num]
-                return Quintet(ROYAL_FLUSH, best_5, 14) if best_5[-1].number == 14 else Quintet(STRAIGHT_FLUSH, best_5, best_5_num[-1])
-            return Quintet(FLUSH, [Card(flushed_number, flush_suit) for flushed_number in flushed_numbers[:-6:-1]], flushed_numbers[-1])
-
-    # checking for duplicates
-    pairs = []
-    threes = []
-    for test_num in range(2, 15):
-        test_num_appearances = numbers.count(test_num)
-        if test_num_appearances == 2:
-            pairs.append(test_num)
-        elif test_num_appearances == 3:
-            threes.append(test_num)
-        elif test_num_appearances == 4:
-            highest_num = choose_highest([num for num in numbers if num != test_num])[0]
-            highest_suit = suits[numbers.index(highest_num)]
-            return Quintet(FOUR_OF_A_KIND, [Card(test_num, suit) for suit in range(4)] + [Card(highest_num, highest_suit)], test_num)
-
-    # full house
-    if threes and pairs:
-        highest_trip, highest_pair = sorted(threes)[-1], sorted(pairs)[-1]
-        return Quintet(FULL_HOUSE, [card for card in cards if card.number == highest_trip or card.number == highest_pair], highest_trip)
-    if len(threes) == 2:
-        highest_trip, highest_pair = sorted(threes)[-1], sorted(threes)[-2]
-        triplet = [card for card in cards if card.number == highest_trip]
-        double = [card for card in cards if card.number == highest_pair][:2]
-        return Quintet(FULL_HOUSE, triplet + double, highest_trip)
-
-    # straight
-    is_not_not_straight, best_5 = is_straight(numbers)
-    if is_not_not_straight:
-        straight_cards = []
-        for number in best_5:
-            straight_cards.append([card for card in cards if card.number == number][0])
-        return Quintet(STRAIGHT, straight_cards, best_5[-1])
-
-    # normal trip
-    if threes:
-        highest_three = sorted(threes)[-1]
-        highest_remaining_two = choose_highest([num for num in numbers if num != highest_three], 2)
-        return Quintet(THREE, [card for card in cards if card.number in [highest_three] + highest_remaining_two], highest_three)
-        # don't have to worry about duplicates in the highest_remaining_two, because if there were it would've been
-        # a full house
-
-    # two pair
+        mask |= card.bit
+    return mask
+
+def mask_to_indices(mask):
+    """turns a 52 bit mask into the card indices set in it, lowest first"""
+    indices = []
+    while mask:
+        low_bit = mask & -mask
+        indices.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+    return indices
+
+def mask_to_cards(mask):
+    """turns a 52 bit mask into the (interned) cards set in it"""
+    return [CARDS[index] for index in mask_to_indices(mask)]
+
+def indices_to_cards(indices):
+    """turns card indices into the (interned) cards"""
+    return [CARDS[index] for index in indices]
+
+def pairs_from_combos(combos):
+    """turns combo slots (as from hands_after_5) into pairs of cards, lower index first, sorted like pair_num"""
+    return [COMBO_PAIRS[combo] for combo in sorted(combos, key=COMBO_ORDER.__getitem__)]
+
+
+"""EVALUATOR"""
+# every 5-7 card set scores as one integer from 1 (7 5 4 3 2 high) to 7462 (royal flush). bigger is better, equal is a
+# split. internally card strengths go 0..12 for 2..ace, unlike card numbers which go 1..13 with ace as 1.
+# cards are indexed by card.index, i.e. number - 1 + 13 * suit
+STRENGTH = [(index % 13 - 1) % 13 for index in range(52)]
+RANK_KEY = [5 ** strength for strength in STRENGTH]  # one base 5 digit per strength, counts up to 4 never carry
+SUIT_KEY = [1 << 4 * (index // 13) for index in range(52)]  # one nibble per suit, a nibble hits 5 only on a flush
+WHEEL_MASK = 0b1000000001111
+# how many of each strength are in the encoded best 5 of each category, in the order they're encoded
+CATEGORY_GROUPS = {FOUR_OF_A_KIND: (4, 1), FULL_HOUSE: (3, 2), THREE: (3, 1, 1), TWO_PAIR: (2, 2, 1),
+                   PAIR: (2, 1, 1, 1), HIGH: (1, 1, 1, 1, 1), FLUSH: (1, 1, 1, 1, 1)}
+
+def evaluate(cards):
+    """takes in 5-7 card indices, returns integer strength of the best 5 (bigger is better, equal is a split)"""
+    if not _tables_loaded:
+        ensure_tables()
+    key = suits = 0
+    for card in cards:
+        key += RANK_KEY[card]
+        suits += SUIT_KEY[card]
+    flush = (suits + 0x3333) & 0x8888
+    if flush:
+        flush_suit = flush.bit_length() // 4 - 1
+        flush_bits = 0
+        for card in cards:
+            if card // 13 == flush_suit:
+                flush_bits |= 1 << card % 13
+        return FLUSH_RANK[flush_bits]
+    return NONFLUSH_RANK[key]
+
+def evaluate_mask(mask):
+    """same as evaluate, but takes in a 52 bit mask of 5-7 cards"""
+    if not _tables_loaded:
+        ensure_tables()
+    for suit in range(4):
+        suited = mask >> 13 * suit & 0x1FFF
+        if suited.bit_count() >= 5:
+            return FLUSH_RANK[suited]
+    return NONFLUSH_RANK[sum([RANK_KEY[index] for index in mask_to_indices(mask)])]
+
+def rank_category(rank):
+    """gives the win type (HIGH to ROYAL_FLUSH) of an integer strength from evaluate"""
+    if not _tables_loaded:
+        ensure_tables()
+    return RANK_ENCODED[rank] >> 20
+
+def rank_strengths(rank):
+    """gives the strengths (0..12 for 2..ace) of the 5 best cards of an integer strength, best first"""
+    if not _tables_loaded:
+        ensure_tables()
+    encoded = RANK_ENCODED[rank]
+    category = encoded >> 20
+    top = encoded >> 16 & 15
+    if category in (STRAIGHT, STRAIGHT_FLUSH, ROYAL_FLUSH):
+        return [3, 2, 1, 0, 12] if top == 3 else list(range(top, top - 5, -1))
+    strengths = []
+    for i, group in enumerate(CATEGORY_GROUPS[category]):
+        strengths += [encoded >> (16 - 4 * i) & 15] * group
+    return strengths
+
+def _encode(category, strengths):
+    """packs a win type and its defining strengths (most important first) into one comparable int"""
+    encoded = category << 20
+    for i, strength in enumerate(strengths):
+        encoded |= strength << (16 - 4 * i)
+    return encoded
+
+def _straight_top(strength_mask):
+    """given a 13 bit mask of strengths, gives strength of the top card of the highest straight, or -1 if none"""
+    for top in range(12, 3, -1):
+        if strength_mask >> (top - 4) & 31 == 31:
+            return top
+    return 3 if strength_mask & WHEEL_MASK == WHEEL_MASK else -1
+
+def _encode_flush(strengths):
+    """encodes the best 5 of 5-7 suited strengths"""
+    top = _straight_top(sum(1 << strength for strength in strengths))
+    if top == 12:
+        return _encode(ROYAL_FLUSH, [top])
+    if top >= 0:
+        return _encode(STRAIGHT_FLUSH, [top])
+    return _encode(FLUSH, sorted(strengths, reverse=True)[:5])
+
+def _encode_counts(counts):
+    """encodes the best 5 of 5-7 cards, ignoring flushes, given how many of each strength there are"""
+    present = [strength for strength in range(12, -1, -1) if counts[strength]]
+    quads = [strength for strength in present if counts[strength] == 4]
+    trips = [strength for strength in present if counts[strength] == 3]
+    pairs = [strength for strength in present if counts[strength] == 2]
+    if quads:
+        return _encode(FOUR_OF_A_KIND, quads[:1] + [strength for strength in present if strength != quads[0]][:1])
+    if trips and (len(trips) > 1 or pairs):
+        return _encode(FULL_HOUSE, [trips[0], max(trips[1:] + pairs)])
+    top = _straight_top(sum(1 << strength for strength in present))
+    if top >= 0:
+        return _encode(STRAIGHT, [top])
+    if trips:
+        return _encode(THREE, trips[:1] + [strength for strength in present if strength != trips[0]][:2])
     if len(pairs) >= 2:
-        pair_nums = sorted(pairs)[-2:]
-        highest_remaining_num = choose_highest([num for num in numbers if num not in pair_nums])[0]
-        highest_remaining_suit = suits[numbers.index(highest_remaining_num)]
-        highest_remaining = [Card(highest_remaining_num, highest_remaining_suit)]
-        return Quintet(TWO_PAIR, [card for card in cards if card.number in pair_nums] + highest_remaining, pair_nums[-1])
-
-    # pair
+        return _encode(TWO_PAIR, pairs[:2] + [strength for strength in present if strength not in pairs[:2]][:1])
     if pairs:
-        highest_remaining_nums = choose_highest([num for num in numbers if num != pairs[0]], 3)
-        return Quintet(PAIR, [card for card in cards if card.number in (pairs + highest_remaining_nums)], pairs[0])
-
-    # high card
-    highest_nums = choose_highest(numbers, 5)
-    return Quintet(HIGH, [card for card in cards if card.number in highest_nums], max(highest_nums))
+        return _encode(PAIR, pairs[:1] + [strength for strength in present if strength != pairs[0]][:3])
+    return _encode(HIGH, present[:5])
+
+def _build_tables():
+    """builds the flush table (indexed by the 13 bit number mask of the flush suit) & non-flush table (by rank key)"""
+    flush_encoded = {}
+    for number_mask in range(1 << 13):
+        if 5 <= bin(number_mask).count('1') <= 7:
+            flush_encoded[number_mask] = _encode_flush([STRENGTH[i] for i in range(13) if number_mask >> i & 1])
+    nonflush_encoded = {}
+    for n_cards in range(5, 8):
+        for strengths in combinations_with_replacement(range(13), n_cards):
+            counts = [0] * 13
+            for strength in strengths:
+                counts[strength] += 1
+            if max(counts) <= 4:
+                nonflush_encoded[sum(5 ** strength for strength in strengths)] = _encode_counts(counts)
+
+    # every distinct best 5 gets a dense rank, in the same order as the encoding
+    rank_encoded = [0] + sorted(set(flush_encoded.values()) | set(nonflush_encoded.values()))
+    dense = {encoded: rank for rank, encoded in enumerate(rank_encoded)}
+    flush_rank = [0] * (1 << 13)
+    for number_mask, encoded in flush_encoded.items():
+        flush_rank[number_mask] = dense[encoded]
+    nonflush_rank = {key: dense[encoded] for key, encoded in nonflush_encoded.items()}
+    return flush_rank, nonflush_rank, rank_encoded
+
+def pack_tables(flush_rank, nonflush_rank, rank_encoded):
+    """packs the lookup tables into one blob: no. of non-flush keys, encoded ranks & non-flush keys (uint32), then
+    flush ranks & non-flush ranks (uint16)"""
+    keys = sorted(nonflush_rank)
+    return b''.join([array('I', [len(keys)]).tobytes(), array('I', rank_encoded).tobytes(), array('I', keys).tobytes(),
+                     array('H', flush_rank).tobytes(), array('H', [nonflush_rank[key] for key in keys]).tobytes()])
+
+def unpack_tables(buffer):
+    """reads tables back out of a pack_tables blob. flush & encoded ranks stay as views onto the buffer (no copying),
+    the non-flush dict is zipped straight back together from its key & rank arrays"""
+    view = memoryview(buffer)
+    n_keys = view[:4].cast('I')[0]
+    offset = 4
+    rank_encoded = view[offset:offset + 4 * N_RANKS].cast('I')
+    offset += 4 * N_RANKS
+    keys = view[offset:offset + 4 * n_keys].cast('I')
+    offset += 4 * n_keys
+    flush_rank = view[offset:offset + 2 * (1 << 13)].cast('H')
+    offset += 2 * (1 << 13)
+    nonflush_rank = dict(zip(keys, view[offset:offset + 2 * n_keys].cast('H')))
+    return flush_rank, nonflush_rank, rank_encoded
+
+def load_tables(flush_rank, nonflush_rank, rank_encoded):
+    """fills the lookup tables in place (so modules that imported them by name see them too), along with everything
+    worked out from them"""
+    global _tables_loaded
+    FLUSH_RANK[:] = flush_rank
+    NONFLUSH_RANK.clear()
+    NONFLUSH_RANK.update(nonflush_rank)
+    RANK_ENCODED[:] = rank_encoded
+    _tables_loaded = True
+    FLUSH_RANK_ARRAY[:] = FLUSH_RANK
+    RANK_ENCODED_ARRAY[:] = RANK_ENCODED
+    # how many cards of each strength are in the best 5 of each rank, for best5 to pick them out with
+    for rank in range(1, N_RANKS):
+        wanted = RANK_WANTED[rank] = [0] * 13
+        for strength in rank_strengths(rank):
+            wanted[strength] += 1
+
+def ensure_tables():
+    """builds the lookup tables if they aren't there yet"""
+    if not _tables_loaded:
+        load_tables(*_build_tables())
+
+def use_shared_tables(name):
+    """loads the lookup tables out of the shared memory block called name (as made by parallel.EvaluatorPool) instead
+    of building them. used as the pool's worker initializer, the block's read once & not held onto"""
+    block = shared_memory.SharedMemory(name)
+    try:
+        packed = bytes(block.buf)
+    finally:
+        block.close()
+    flush_rank, nonflush_rank, rank_encoded = unpack_tables(packed)
+    load_tables(flush_rank.tolist(), nonflush_rank, rank_encoded.tolist())
+
+# the main process builds the tables straight away. worker processes start without them, and get them either from
+# their pool's shared memory block (see use_shared_tables) or by building them the first time they're needed.
+# FLUSH_RANK & RANK_ENCODED also come as arrays, to index with numpy
+N_RANKS = 7463  # including the unused rank 0
+FLUSH_RANK, NONFLUSH_RANK, RANK_ENCODED = [0] * (1 << 13), {}, [0] * N_RANKS
+FLUSH_RANK_ARRAY, RANK_ENCODED_ARRAY = np.zeros(1 << 13, dtype=np.int64), np.zeros(N_RANKS, dtype=np.int64)
+RANK_WANTED = [[0] * 13 for rank in range(N_RANKS)]
+_tables_loaded = False
+if parent_process() is None:
+    ensure_tables()
+
+# every 2 card combo gets a slot 0..1325 (same as ranges): combo (first, second) of card indices, first < second, is
+# at second * (second - 1) / 2 + first. per slot: the pair of cards, where pair_num would sort it, its 52 bit mask &
+# 13 * low strength + high strength, for hands_after_5 to rank them all at once
+COMBO_PAIRS = [(CARDS[first], CARDS[second]) for second in range(52) for first in range(second)]
+COMBO_ORDER = [52 * first.index + second.index for first, second in COMBO_PAIRS]
+COMBO_MASKS = np.array([first.bit | second.bit for first, second in COMBO_PAIRS], dtype=np.int64)
+COMBO_STRENGTH_PAIRS = np.array([13 * min(STRENGTH[first.index], STRENGTH[second.index]) +
+                                 max(STRENGTH[first.index], STRENGTH[second.index]) for first, second in COMBO_PAIRS],
+                                dtype=np.int64)
 
-def better_hands_after_5(your_hand, table):
+def best5(hand, table):
+    """takes in 5 on table and 2 in hand, returns Quintet of win type & 5 best cards"""
+    # checks profiling inline instead of being wrapped by profiling.profiled, the wrapper alone costs ~10% of a call
+    start = profiling.active and time.perf_counter_ns()
+    if not _tables_loaded:
+        ensure_tables()
+    # same as evaluate, inlined on the cards themselves, since the flush suit's needed again to pick the cards out
+    cards = hand + table
+    key = suits = 0
+    for card in cards:
+        index = card.index
+        key += RANK_KEY[index]
+        suits += SUIT_KEY[index]
+    flush = (suits + 0x3333) & 0x8888
+    if flush:
+        flush_suit = flush.bit_length() // 4 - 1
+        cards = [card for card in cards if card.suit == flush_suit]
+        flush_bits = 0
+        for card in cards:
+            flush_bits |= 1 << card.index % 13
+        rank = FLUSH_RANK[flush_bits]
+    else:
+        rank = NONFLUSH_RANK[key]
+    encoded = RANK_ENCODED[rank]
+
+    # picks the actual cards off the table & hand: how many of each strength the best 5 has, taking later cards first
+    wanted = RANK_WANTED[rank][:]
+    best_5 = []
+    for card in reversed(cards):
+        strength = STRENGTH[card.index]
+        if wanted[strength]:
+            wanted[strength] -= 1
+            best_5.append(card)
+    if start:
+        profiling.hit('best5.category', WIN_NAMES[encoded >> 20])
+        profiling.record('best5', start)
+    # defining number counts ace as 14, so it's always 2 more than the strength (top strength is encoded first)
+    return Quintet(encoded >> 20, best_5, (encoded >> 16 & 15) + 2, rank)
+
+@profiling.profiled
+def hands_after_5(your_hand, table):
+    """after all 5 cards are out, splits all 990 opponent hands into sets of better, tied & worse. each hand is its
+    combo slot (see pairs_from_combos for the cards), small ints hash far cheaper than pairs of cards"""
+    your_rank = evaluate([card.index for card in your_hand + table])
+    used_mask = cards_to_mask(your_hand + table)
+    unused = [index for index in range(52) if not used_mask >> index & 1]
+
+    # table's part of the rank key & flush bits are shared by every opponent hand
+    table_key = sum([RANK_KEY[card.index] for card in table])
+    can_flush, flush_suit, suited_table_cards = check_flush_potential(table)
+    if not can_flush:
+        flush_suit, suited_table_cards = -1, []
+    flush_bits = cards_to_mask(suited_table_cards) >> 13 * flush_suit if can_flush else 0
+    needed_for_flush = 5 - len(suited_table_cards)
+
+    # opponent hands of the same two strengths all rank the same unless they make a flush, so there's one lookup per
+    # strength pair (at most 91) instead of one per hand, then numpy spreads the ranks over all 1326 combos
+    left = [0] * 13  # cards of each strength not used yet
+    for index in unused:
+        left[STRENGTH[index]] += 1
+    strength_pair_ranks = np.zeros(13 * 13, dtype=np.int64)
+    for high in range(13):
+        if left[high]:
+            for low in range(high + 1):
+                if left[low] > (low == high):
+                    key = table_key + 5 ** low + 5 ** high
+                    strength_pair_ranks[13 * low + high] = NONFLUSH_RANK[key]
+    live = (COMBO_MASKS & used_mask) == 0
+    ranks = strength_pair_ranks[COMBO_STRENGTH_PAIRS]
+    if can_flush:
+        flush_cards = 0x1FFF << 13 * flush_suit
+        suited = COMBO_MASKS & flush_cards
+        flushing = live & (np.bitwise_count(suited) >= needed_for_flush)
+        ranks[flushing] = FLUSH_RANK_ARRAY[flush_bits | suited[flushing] >> 13 * flush_suit]
+    better = set(np.flatnonzero(live & (ranks > your_rank)).tolist())
+    tied = set(np.flatnonzero(live & (ranks == your_rank)).tolist())
+    worse = set(np.flatnonzero(live & (ranks < your_rank)).tolist())
+    if profiling.active:
+        for outcome, hands in (('better', better), ('tied', tied), ('worse', worse)):
+            profiling.hit('hands_after_5.opponent_hands', outcome, len(hands))
+    return better, tied, worse
+
+@profiling.profiled
+def better_hands_after_5(your_hand, table, legacy=False):
+    """after all 5 cards are out, gives the opponent hands that beat yours (legacy=True for the old case by case way)"""
+    if legacy:
+        return better_hands_after_5_legacy(your_hand, table)
+    return pairs_from_combos(hands_after_5(your_hand, table)[0])
+
+@profiling.profiled
+def better_hands_after_5_legacy(your_hand, table):
     """after all 5 cards are out, checks to see how many hands are better than yours"""
     # your_hand is your hand, table is table, other_hands is while recursive, finds better hands
     your_quintet = best5(your_hand, table)
+    # which of the branches below get looked into, as hits on the 'better_hands_after_5_legacy.branch' histogram
+    branch = _branch_hit if profiling.active else _no_hit
     used_cards = your_hand + table
-    unused_cards = [card for card in FULL_SET if card not in used_cards]
+    used_mask = cards_to_mask(used_cards)
+    unused_cards = [card for card in FULL_SET if not used_mask & card.bit]
     better_hands = []
     # check all the hands that are greater than yours, then same but higher number
 
@@ -145,6 +438,7 @@ def better_hands_after_5(your_hand, table):
         # if your hand is worse than flush, doesn't check here, since will be included in flush anyways
         # if your hand is a flush, then that's a different matter. will be checked with the flush checks
         cards_for_straight = check_straight_potential(suited_table_cards)
+        branch('straight_flush')
         [add_hand_if_valid(better_hands, [Card(num_pair[0], flush_suit), Card(num_pair[1], flush_suit)]) for num_pair in cards_for_straight]
 
     # saving nums & dups for later for later
@@ -152,6 +446,7 @@ def better_hands_after_5(your_hand, table):
     # if four of a kind is on the table, no better hands from here on out
     if sum([table_nums.count(num) == 4 for num in set(table_nums)]) > 0:
         """HAVE TO ACCOUNT FOR HIGHER CARDS TO SEE WHO WINS"""
+        branch('table_four_of_a_kind')
         return better_hands
 
     # saves triples and doubles that are on the table, for further checking
@@ -162,11 +457,12 @@ def better_hands_after_5(your_hand, table):
     # looking for four of a kind
     if your_quintet.type < FOUR_OF_A_KIND:
         # if your hand is worse than four of a kind, look for four of a kind
+        branch('four_of_a_kind')
         if table_triple:
             # if there's a triple on the board, add hands which can have the last card
             for triple_num in table_triple:
                 required_card = Card(triple_num, 6 - sum([card.suit for card in table if card.number == triple_num]))
-                [add_hand_if_valid(better_hands, [required_card, Card(num, suit)]) for num in range(1, 14) for suit in range(4) if Card(num, suit) not in used_cards and Card(num, suit) != required_card]
+                [add_hand_if_valid(better_hands, [required_card, Card(num, suit)]) for num in range(1, 14) for suit in range(4) if not used_mask & Card(num, suit).bit and Card(num, suit) != required_card]
         if table_double:
             # if there's a double on the board
             for double_num in table_double:
@@ -176,6 +472,7 @@ def better_hands_after_5(your_hand, table):
 
     # looking for full house
     if your_quintet.type < FULL_HOUSE:
+        branch('full_house')
         if table_triple:
             # if triple on table, only need a double to win
             # first check for pairs with remaining two table cards
@@ -184,14 +481,14 @@ def better_hands_after_5(your_hand, table):
                     continue
                 for pair_suit in [suit for suit in range(4) if suit != table_card.suit]:
                     pair_card = Card(table_card.number, pair_suit)
-                    if pair_card in used_cards:
+                    if used_mask & pair_card.bit:
                         continue
-                    [add_hand_if_valid(better_hands, [pair_card, Card(num, suit)]) for num in range(1, 14) for suit in range(4) if Card(num, suit) not in used_cards]
+                    [add_hand_if_valid(better_hands, [pair_card, Card(num, suit)]) for num in range(1, 14) for suit in range(4) if not used_mask & Card(num, suit).bit]
             # then check for pocket pairs
             for num in range(1, 14):
                 if num == table_triple:
                     continue
-                [add_hand_if_valid(better_hands, [Card(num, suits[0]), Card(num, suits[1])]) for suits in SUIT_COMBOS if Card(num, suits[0]) not in used_cards and Card(num, suits[1]) not in used_cards]
+                [add_hand_if_valid(better_hands, [Card(num, suits[0]), Card(num, suits[1])]) for suits in SUIT_COMBOS if not used_mask & Card(num, suits[0]).bit and not used_mask & Card(num, suits[1]).bit]
         if len(table_double) == 1:
             # if one double on table, need one of double and another single
             required_num = table_double[0]
@@ -199,10 +496,10 @@ def better_hands_after_5(your_hand, table):
             remaining_suits = [suit for suit in range(4) if suit not in used_suits]
             for double_suit in remaining_suits:
                 required_double = Card(required_num, double_suit)
-                if required_double in used_cards:
+                if used_mask & required_double.bit:
                     continue
                 usable_nums = [card.number for card in table if card.number != required_num]
-                [add_hand_if_valid(better_hands, [required_double, Card(num, suit)]) for num in usable_nums for suit in range(4) if Card(num, suit) not in used_cards]
+                [add_hand_if_valid(better_hands, [required_double, Card(num, suit)]) for num in usable_nums for suit in range(4) if not used_mask & Card(num, suit).bit]
         elif len(table_double) == 2:
             # if two doubles on table, only need one more card to win...
             for required_num in table_double:
@@ -210,16 +507,17 @@ def better_hands_after_5(your_hand, table):
                 remaining_suits = [suit for suit in range(4) if suit not in used_suits]
                 for required_suit in remaining_suits:
                     required_card = Card(required_num, required_suit)
-                    if required_card in used_cards:
+                    if used_mask & required_card.bit:
                         continue
-                    [add_hand_if_valid(better_hands, [required_card, Card(num, suit)]) for num in range(1,14) for suit in range(4) if Card(num, suit) not in used_cards]
+                    [add_hand_if_valid(better_hands, [required_card, Card(num, suit)]) for num in range(1,14) for suit in range(4) if not used_mask & Card(num, suit).bit]
             # ... or if pocket pair with remaining card
             remaining_num = [card for card in table if card.number not in table_double][0].number
-            [add_hand_if_valid(better_hands, [Card(remaining_num, suits[0]), Card(remaining_num, suits[1])]) for suits in SUIT_COMBOS if Card(remaining_num, suits[0]) not in used_cards and Card(remaining_num, suits[1]) not in used_cards]
+            [add_hand_if_valid(better_hands, [Card(remaining_num, suits[0]), Card(remaining_num, suits[1])]) for suits in SUIT_COMBOS if not used_mask & Card(remaining_num, suits[0]).bit and not used_mask & Card(remaining_num, suits[1]).bit]
 
     # looking for flushes
     if your_quintet.type < FLUSH:
         # uses check_flush_potential from earlier
+        branch('flush')
         if can_flush:
             flushed_table_nums = [card.number for card in suited_table_cards]
             flushed_hand = [card.number for card in your_hand if card.suit == flush_suit]
@@ -235,24 +533,26 @@ def better_hands_after_5(your_hand, table):
                 usable_nums = [i for i in range(1, 14) if i not in flushed_table_nums and i not in flushed_hand]
                 for usable_num in usable_nums:
                     required_card = Card(usable_num, flush_suit)
-                    [add_hand_if_valid(better_hands, [required_card, Card(num, other_suit)]) for num in range(1, 14) for other_suit in range(4) if Card(num, other_suit) not in used_cards and Card(num, flush_suit) != required_card]
+                    [add_hand_if_valid(better_hands, [required_card, Card(num, other_suit)]) for num in range(1, 14) for other_suit in range(4) if not used_mask & Card(num, other_suit).bit and Card(num, flush_suit) != required_card]
             # no need to account for 5 flushed on table here, since it counts as everyone having a flush. and that's a different issue.
 
     # looking for straights
     if your_quintet.type < STRAIGHT:
         # checks for straight potential
+        branch('straight')
         winning_nums = check_straight_potential(table)
-        [add_hand_if_valid(better_hands, [Card(num_pair[0], suit_pair[0]), Card(num_pair[1], suit_pair[1])]) for num_pair in winning_nums for suit_pair in SUIT_COMBOS if Card(num_pair[0], suit_pair[0]) not in used_cards and Card(num_pair[1], suit_pair[1]) not in used_cards]
+        [add_hand_if_valid(better_hands, [Card(num_pair[0], suit_pair[0]), Card(num_pair[1], suit_pair[1])]) for num_pair in winning_nums for suit_pair in SUIT_COMBOS if not used_mask & Card(num_pair[0], suit_pair[0]).bit and not used_mask & Card(num_pair[1], suit_pair[1]).bit]
 
     # looking for triples
     if your_quintet.type < THREE:
         # doesn't care about table triples, since that means everyone has a triple, and that's a different case
+        branch('three')
 
         # checks for completing a double. doesn't matter if you try to add a full house accidentally.
         for double_num in table_double:
             for trip_completer_suit in range(4):
                 trip_completer = Card(double_num, trip_completer_suit)
-                if trip_completer in used_cards:
+                if used_mask & trip_completer.bit:
                     continue
                 [add_hand_if_valid(better_hands, [trip_completer, other_card]) for other_card in unused_cards]
         
@@ -267,6 +567,7 @@ def better_hands_after_5(your_hand, table):
     if your_quintet.type < TWO_PAIR:
         # doesn't care about table triples, since if there was, you'd already have a trip, whcih is better than twopair
         # table double must only have 1 thing, since if there were 2, you'd already have a twopair
+        branch('two_pair')
         if table_double:
             # you only need a pair from one of the singles...
             required_num = table_double[0]
@@ -278,16 +579,17 @@ def better_hands_after_5(your_hand, table):
             potential_pocket_nums = list(range(1, 14))
             potential_pocket_nums.remove(required_num)
             [potential_pocket_nums.remove(num) for num in table_single]
-            [add_hand_if_valid(better_hands, [Card(num, suits[0]), Card(num, suits[1])]) for num in potential_pocket_nums for suits in SUIT_COMBOS if Card(num, suits[0]) not in used_cards and Card(num, suits[1]) not in used_cards]
+            [add_hand_if_valid(better_hands, [Card(num, suits[0]), Card(num, suits[1])]) for num in potential_pocket_nums for suits in SUIT_COMBOS if not used_mask & Card(num, suits[0]).bit and not used_mask & Card(num, suits[1]).bit]
 
         else:
             # then the table is full of singles, and you've just got to match two of them
             winning_hands_nums = list(permutations([card.number for card in table], 2))
-            [add_hand_if_valid(better_hands, [Card(pair_nums[0], suits[0]), Card(pair_nums[1], suits[1])]) for pair_nums in winning_hands_nums for suits in SUIT_COMBOS if Card(pair_nums[0], suits[0]) not in used_cards and Card(pair_nums[1], suits[1]) not in used_cards]
+            [add_hand_if_valid(better_hands, [Card(pair_nums[0], suits[0]), Card(pair_nums[1], suits[1])]) for pair_nums in winning_hands_nums for suits in SUIT_COMBOS if not used_mask & Card(pair_nums[0], suits[0]).bit and not used_mask & Card(pair_nums[1], suits[1]).bit]
 
     # looking for pairs
     if your_quintet.type < PAIR:
         # the table must be full of singles, since if there was a pair on the table, you'd have a pair
+        branch('pair')
         for sing_num in table_single:
             remaining_suits = [0, 1, 2, 3]
             [remaining_suits.remove(card.suit) for card in used_cards if card.number == sing_num]
@@ -298,6 +600,7 @@ def better_hands_after_5(your_hand, table):
 
     if your_quintet.type == STRAIGHT_FLUSH:
         # first looks for your highest card
+        branch('same_straight_flush')
         your_nums = [card.number for card in your_quintet.cards]
         your_highest = max(your_nums)
 
@@ -330,42 +633,63 @@ def choose_highest(choices, n=1):
     """chooses the highest n within choices (list of card numbers)"""
     return sorted(choices)[len(choices)-n:]
 
-def check_flush_potential(table):
-    """given 5 cards on the table, checks for flush potential, and if so, gives card of that suit"""
+def check_flush_potential(table, min_suited=3):
+    """given cards on the table, checks for flush potential (at least min_suited of a suit), and if so, gives cards of
+    that suit"""
     for flush_suit in range(4):
         suited_cards = [card for card in table if card.suit == flush_suit]
-        if len(suited_cards) >= 3:
+        if len(suited_cards) >= min_suited:
             return True, flush_suit, suited_cards
     return False, None, None
 
+# bits start..start + 4 for each straight, by number with ace as both 1 and 14 (bit n is number n)
+NUMBER_WINDOW_MASKS = [(straight_start, 0b11111 << straight_start) for straight_start in range(1, 11)]
+
+def straight_numbers_mask(cards):
+    """mask of the numbers in cards, bit n for number n, ace as both 1 and 14 (to line up with NUMBER_WINDOW_MASKS)"""
+    numbers_mask = 0
+    for card in cards:
+        numbers_mask |= 1 << card.number
+    if numbers_mask & 2:
+        numbers_mask |= 1 << 14
+    return numbers_mask
+
 def check_straight_potential(table):
     """given cards on the table, check for missing 0-2 cards to straight, and if so, gives pairs of nums that complete it"""
-    # sorts it in descending order
-    numbers = sorted(list(set([card.number for card in table])))[::-1]
-    winning_nums = []
-    if 1 in numbers:
-        numbers.insert(0, 14)
-    for straight_start in range(1, 11):
-        counted_in_straight = [num >= straight_start and num <= straight_start + 4 for num in numbers]
-        if sum(counted_in_straight) == 3:
-            existing_straighters = [numbers[i] for i, counted in enumerate(counted_in_straight) if counted]
-            winning_pair = tuple(sorted([(1 if num == 14 else num) for num in range(straight_start, straight_start+5) if num not in existing_straighters]))
-            if winning_pair not in winning_nums:
-                winning_nums.append(winning_pair)
-        elif sum(counted_in_straight) == 4:
-            existing_straighters = [numbers[i] for i, counted in enumerate(counted_in_straight) if counted]
-            winning_number = [(1 if num == 14 else num) for num in range(straight_start, straight_start+5) if num not in existing_straighters][0]
-            winning_nums += [tuple(sorted((winning_number, i))) for i in range(1, 14) if (i < straight_start or i > straight_start + 4) and tuple(sorted((winning_number, i))) not in winning_nums]
-    return winning_nums
+    numbers_mask = straight_numbers_mask(table)
+    # dict rather than list, for O(1) duplicate checks that still keep the order they were found in
+    winning_nums = {}
+    for straight_start, window_mask in NUMBER_WINDOW_MASKS:
+        missing_mask = window_mask & ~numbers_mask
+        if missing_mask.bit_count() > 2:
+            continue
+        missing = [(1 if num == 14 else num) for num in range(straight_start, straight_start + 5) if missing_mask >> num & 1]
+        if len(missing) == 2:
+            winning_nums[tuple(sorted(missing))] = None
+        elif len(missing) == 1:
+            for num in range(1, 14):
+                if num < straight_start or num > straight_start + 4:
+                    winning_nums[tuple(sorted((missing[0], num)))] = None
+    return list(winning_nums)
 
 def add_hand_if_valid(better_hands, pair_of_cards):
     """helper function to add pair_of_cards (list). ensured added to better_hands correctly and avoids duplicates"""
     # NOTE that it doesn't check if the pair of cards is already used
     tuple_to_add = tuple(sorted(pair_of_cards, key=hash))
     if tuple_to_add in better_hands or pair_of_cards[0] == pair_of_cards[1]: # tuple_to_add in better_hands or 
+        if profiling.active:
+            profiling.hit('add_hand_if_valid', 'duplicate' if tuple_to_add in better_hands else 'same_card')
         return
+    if profiling.active:
+        profiling.hit('add_hand_if_valid', 'added')
     better_hands.append(tuple_to_add)
 
+def _branch_hit(name):
+    profiling.hit('better_hands_after_5_legacy.branch', name)
+
+def _no_hit(name):
+    pass
+
 pair_num = lambda pair : 52 * hash(pair[0]) + hash(pair[1])
 
 """---------------------------------------------------------------------------------------------------------------------"""
@@ -393,9 +717,9 @@ if __name__ == '__main__':
     for hand in better_hands:
         print(f'{hand[0]}, {hand[1]}')
     print(f'No Duplicates?       {len(better_hands) == len(set(better_hands))}')
-    print(f'Used used cards?     {sum([card in card_pair for card in used_cards for card_pair in better_hands]) != 0}')
+    print(f'Used used cards?     {(cards_to_mask(used_cards) & cards_to_mask([card for card_pair in better_hands for card in card_pair])) != 0}')
     print(f'No. of better hands: {len(better_hands)}')
     print(f'Total no. of hands:  {45*44//2}')
-    # total_hands = [(Card(num1, suit1), Card(num2, suit2)) for num1 in range(1, 14) for num2 in range(1, 14) for suit1 in range(4) for suit2 in range(4) if Card(num1, suit1) != Card(num2, suit2) and Card(num1, suit1) not in used_cards and Card(num2, suit2) not in used_cards]
+    # total_hands = [(Card(num1, suit1), Card(num2, suit2)) for num1 in range(1, 14) for num2 in range(1, 14) for suit1 in range(4) for suit2 in range(4) if Card(num1, suit1) != Card(num2, suit2) and not used_mask & Card(num1, suit1).bit and not used_mask & Card(num2, suit2).bit]
     # print(len(total_hands)) # note that you should divide this by 2 because this one double counts swapsies
     print()
@@ -0,0 +1,134 @@
+from functools import partial
+from itertools import combinations, islice
+from math import comb, sqrt
+import datetime
+import random
+
+import numpy as np
+
+from classes import Card, cards_to_mask, HEART, CLUB, SPADE
+from batch import best5_batch
+from utils import ordered_map
+
+class EquityResult:
+    def __init__(self, wins, ties, losses, share, share_squared, deals, exhaustive):
+        self.deals = deals
+        self.win = wins / deals
+        self.tie = ties / deals
+        self.loss = losses / deals
+        self.equity = share / deals  # ties count as your cut of the pot
+        # standard error of equity, 0 if every runout was enumerated
+        self.stderr = 0.0 if exhaustive else sqrt(max(share_squared / deals - self.equity ** 2, 0) / deals)
+        self.exhaustive = exhaustive
+
+    def __str__(self):
+        how = 'exhaustive' if self.exhaustive else f'stderr {self.stderr:.4f}'
+        return f'win {self.win:.4f}, tie {self.tie:.4f}, loss {self.loss:.4f}, equity {self.equity:.4f} ' \
+               f'over {self.deals} deals ({how})'
+
+def equity(hand, board, n_opponents=1, seed=0, target_stderr=0.002, max_deals=200000, exhaustive_limit=1100000,
+           batch_size=2000, executor=None):
+    """equity of hand (2 cards) against n_opponents random hands, with 0, 3, 4 or 5 board cards out.
+    enumerates every runout & opponent hand if there are at most exhaustive_limit deals, otherwise samples batches of
+    deals (seeded) until the standard error gets down to target_stderr or max_deals is hit.
+    batches get scored on executor if one's given (see parallel.py), with the same result as scoring them here"""
+    if len(hand) != 2:
+        raise ValueError(f'hand has to have 2 cards, not {len(hand)}')
+    if len(board) not in (0, 3, 4, 5):
+        raise ValueError(f'board has to have 0, 3, 4 or 5 cards, not {len(board)}')
+    used_mask = cards_to_mask(hand + board)
+    if used_mask.bit_count() != len(hand) + len(board):
+        raise ValueError('hand & board have a card in common (or a card twice)')
+    deck = [index for index in range(52) if not used_mask >> index & 1]
+    n_board = 5 - len(board)
+    if not 1 <= n_opponents <= (len(deck) - n_board) // 2:
+        raise ValueError(f'n_opponents has to be 1 to {(len(deck) - n_board) // 2} with {len(board)} on the board, '
+                         f'not {n_opponents}')
+
+    totals = [0, 0, 0, 0, 0]  # wins, ties, losses, share, share squared
+    exhaustive = count_deals(len(deck), n_board, n_opponents) <= exhaustive_limit
+    if exhaustive:
+        all_deals = enumerate_deals(deck, n_board, n_opponents)
+        batches = iter(lambda: list(islice(all_deals, batch_size)), [])
+        for batch_totals in scored_batches(hand, board, batches, n_opponents, executor):
+            add_totals(totals, batch_totals)
+    else:
+        rng = random.Random(seed)
+        batches = (sample_deals(rng, deck, n_board, n_opponents, min(batch_size, max_deals - drawn))
+                   for drawn in range(0, max_deals, batch_size))
+        for batch_totals in scored_batches(hand, board, batches, n_opponents, executor):
+            add_totals(totals, batch_totals)
+            if EquityResult(*totals, sum(totals[:3]), False).stderr <= target_stderr:
+                break
+    return EquityResult(*totals, sum(totals[:3]), exhaustive)
+
+"""DEALING"""
+def count_deals(deck_size, n_board, n_opponents):
+    """how many deals there are of n_board board cards then 2 cards for each opponent (opponents in order)"""
+    deals = comb(deck_size, n_board)
+    for opponent in range(n_opponents):
+        deals *= comb(deck_size - n_board - 2 * opponent, 2)
+    return deals
+
+def enumerate_deals(deck, n_board, n_opponents):
+    """yields every deal (as a tuple of card indices) of n_board board cards then 2 cards for each opponent"""
+    for runout in combinations(deck, n_board):
+        runout_mask = sum([1 << index for index in runout])
+        for holdings in _enumerate_holdings([index for index in deck if not runout_mask >> index & 1], n_opponents):
+            yield runout + holdings
+
+def _enumerate_holdings(deck, n_opponents):
+    """yields every way to give 2 cards to each of n_opponents from deck"""
+    if n_opponents <= 1:
+        yield from combinations(deck, 2) if n_opponents else [()]
+        return
+    for pair in combinations(deck, 2):
+        for others in _enumerate_holdings([index for index in deck if index not in pair], n_opponents - 1):
+            yield pair + others
+
+def sample_deals(rng, deck, n_board, n_opponents, n_deals):
+    """random deals in the same layout as enumerate_deals"""
+    n_cards = n_board + 2 * n_opponents
+    return [rng.sample(deck, n_cards) for _ in range(n_deals)]
+
+"""SCORING"""
+def score_deals(hand, board, deals, n_opponents):
+    """scores a batch of deals, gives totals of wins, ties, losses, equity share & equity share squared. every
+    player's 7 cards in the batch get ranked in one best5_batch call"""
+    deals = np.asarray(deals, dtype=np.int64).reshape(len(deals), -1)
+    n_board = 5 - len(board)
+    full_boards = np.hstack([np.tile([card.index for card in board], (len(deals), 1)), deals[:, :n_board]])
+    holdings = [np.tile([card.index for card in hand], (len(deals), 1))] + \
+        [deals[:, opponent:opponent + 2] for opponent in range(n_board, n_board + 2 * n_opponents, 2)]
+    # rows are every deal for you, then every deal for each opponent in turn
+    ranks = best5_batch(np.hstack([np.vstack(holdings), np.tile(full_boards, (n_opponents + 1, 1))]))[0]
+    ranks = ranks.reshape(n_opponents + 1, len(deals))
+    your_ranks, best_ranks = ranks[0], ranks[1:].max(axis=0)
+    n_best = (ranks[1:] == best_ranks).sum(axis=0)
+    won, tied = your_ranks > best_ranks, your_ranks == best_ranks
+    tie_shares = 1 / (n_best[tied] + 1)
+    wins, ties = int(won.sum()), int(tied.sum())
+    return wins, ties, len(deals) - wins - ties, wins + float(tie_shares.sum()), wins + float((tie_shares ** 2).sum())
+
+def scored_batches(hand, board, batches, n_opponents, executor=None, in_flight=32):
+    """yields score_deals totals for each batch in order, scored on executor if one's given (see utils.ordered_map)"""
+    return ordered_map(partial(score_deals, hand, board, n_opponents=n_opponents), batches, executor, in_flight)
+
+def add_totals(totals, batch_totals):
+    """adds batch totals from score_deals onto running totals, in place"""
+    for i, batch_total in enumerate(batch_totals):
+        totals[i] += batch_total
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    print()
+    hand_test = [Card(8, SPADE), Card(10, HEART)]
+    table_test = [Card(3, HEART), Card(1, CLUB), Card(11, CLUB), Card(8, CLUB), Card(12, HEART)]
+
+    for n_table in (0, 3, 4, 5):
+        start_time = datetime.datetime.now()
+        result = equity(hand_test, table_test[:n_table], n_opponents=2)
+        end_time = datetime.datetime.now()
+        print(f'{n_table} on table: {result}')
+        print(f'Time for equity:    {end_time-start_time}\n')
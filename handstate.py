@@ -0,0 +1,138 @@
+import datetime
+
+from classes import (Card, CARDS, ensure_tables, FLUSH_RANK, NONFLUSH_RANK, RANK_KEY, STRENGTH, rank_category,
+                     WIN_NAMES, SUIT_NAMES, FOUR_OF_A_KIND, FULL_HOUSE, THREE, TWO_PAIR, PAIR, HIGH, HEART, CLUB, SPADE)
+
+# the 10 straights as windows of strengths, wheel (ace low) first, then 6 high up to ace high
+STRAIGHT_WINDOWS = [(12, 0, 1, 2, 3)] + [tuple(range(top - 4, top + 1)) for top in range(4, 13)]
+STRAIGHT_WINDOW_MASKS = [sum(1 << strength for strength in window) for window in STRAIGHT_WINDOWS]
+STRENGTH_WINDOWS = [[i for i, window in enumerate(STRAIGHT_WINDOWS) if strength in window] for strength in range(13)]
+
+def strength_number(strength):
+    """card number (ace as 1) of a strength (0..12 for 2..ace)"""
+    return (strength + 1) % 13 + 1
+
+class HandState:
+    """a player's known cards (hand + board so far) kept as running counts, so adding or removing a card is O(1)
+    and the current category, draws & outs can be read off at any point"""
+    def __init__(self, cards=()):
+        ensure_tables()  # reads the lookup tables directly, which a worker process might not have loaded yet
+        self.mask = 0  # 52 bit mask of the cards
+        self.n_cards = 0
+        self.key = 0  # rank histogram, as the evaluator's base 5 rank key
+        self.counts = [0] * 13  # how many of each strength
+        self.count_of_counts = [13, 0, 0, 0, 0]  # how many strengths appear 0, 1, 2, 3 & 4 times
+        self.suit_counts = [0] * 4
+        self.suit_bits = [0] * 4  # 13 bit number mask per suit, as FLUSH_RANK is indexed
+        self.window_counts = [0] * len(STRAIGHT_WINDOWS)  # how many strengths of each straight are there
+        for card in cards:
+            self.add(card)
+
+    def __str__(self):
+        cards = [str(CARDS[index]) for index in range(52) if self.mask >> index & 1]
+        return f'{WIN_NAMES[self.category()]} from {cards}'
+
+    def add(self, card):
+        if self.mask & card.bit:
+            raise ValueError(f'{card} is already in the hand state')
+        if self.n_cards == 7:
+            raise ValueError('hand state already has 7 cards')
+        self.mask |= card.bit
+        self.n_cards += 1
+        self._count(card.index, 1)
+
+    def remove(self, card):
+        if not self.mask & card.bit:
+            raise ValueError(f'{card} is not in the hand state')
+        self.mask ^= card.bit
+        self.n_cards -= 1
+        self._count(card.index, -1)
+
+    def _count(self, index, step):
+        """moves every running count by step (1 to add the card at index, -1 to remove it)"""
+        strength, suit = STRENGTH[index], index // 13
+        self.key += step * RANK_KEY[index]
+        self.suit_counts[suit] += step
+        self.suit_bits[suit] ^= 1 << index % 13
+        count = self.counts[strength]
+        self.count_of_counts[count] -= 1
+        self.count_of_counts[count + step] += 1
+        self.counts[strength] = count + step
+        # a strength only moves the straight windows when it first turns up or last goes away
+        if count + step == 1 and step == 1 or count == 1 and step == -1:
+            for window in STRENGTH_WINDOWS[strength]:
+                self.window_counts[window] += step
+
+    def rank(self):
+        """integer strength (as from evaluate) of the best 5, needs 5 to 7 cards"""
+        if self.n_cards < 5:
+            raise ValueError(f'need at least 5 cards to rank, have {self.n_cards}')
+        for suit in range(4):
+            if self.suit_counts[suit] >= 5:
+                return FLUSH_RANK[self.suit_bits[suit]]
+        return NONFLUSH_RANK[self.key]
+
+    def category(self):
+        """current best win type, HIGH to ROYAL_FLUSH"""
+        if self.n_cards >= 5:
+            return rank_category(self.rank())
+        # under 5 cards there can't be straights or flushes, so it's only about duplicates
+        count_of_counts = self.count_of_counts
+        if count_of_counts[4]:
+            return FOUR_OF_A_KIND
+        if count_of_counts[3]:
+            return FULL_HOUSE if count_of_counts[2] else THREE
+        if count_of_counts[2]:
+            return TWO_PAIR if count_of_counts[2] >= 2 else PAIR
+        return HIGH
+
+    def flush_draws(self):
+        """suits with exactly 4 cards, i.e. one off a flush"""
+        return [suit for suit in range(4) if self.suit_counts[suit] == 4]
+
+    def straight_draws(self):
+        """card numbers that would fill a straight that's one card off (4 of its 5 strengths there)"""
+        numbers = set()
+        for window, window_count in enumerate(self.window_counts):
+            if window_count == 4:
+                missing = [strength for strength in STRAIGHT_WINDOWS[window] if not self.counts[strength]][0]
+                numbers.add(strength_number(missing))
+        return sorted(numbers)
+
+    def outs(self):
+        """unseen cards that would each move the best win type up, as {new win type: [cards]}. none at 7 cards, as no
+        more are coming"""
+        if self.n_cards == 7:
+            return {}
+        current = self.category()
+        outs = {}
+        for index in range(52):
+            if self.mask >> index & 1:
+                continue
+            card = CARDS[index]
+            self.add(card)
+            category = self.category()
+            self.remove(card)
+            if category > current:
+                outs.setdefault(category, []).append(card)
+        return outs
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    print()
+    hand_test = [Card(8, SPADE), Card(10, HEART)]
+    table_test = [Card(9, HEART), Card(1, HEART), Card(11, CLUB), Card(8, HEART), Card(12, HEART)]
+
+    state = HandState(hand_test)
+    for card in table_test:
+        start_time = datetime.datetime.now()
+        state.add(card)
+        category = state.category()
+        end_time = datetime.datetime.now()
+        print(f'{state}')
+        print(f'Time to add & categorise: {end_time-start_time}')
+        print(f'Flush draws:              {[SUIT_NAMES[suit] for suit in state.flush_draws()]}')
+        print(f'Straight draws:           {state.straight_draws()}')
+        print(f'Outs:                     { {WIN_NAMES[k]: len(v) for k, v in state.outs().items()} }')
+        print()
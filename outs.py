@@ -0,0 +1,90 @@
+import datetime
+
+from classes import (Card, CARDS, cards_to_mask, check_flush_potential, evaluate, rank_category,
+                     straight_numbers_mask, NUMBER_WINDOW_MASKS, WIN_NAMES, SUIT_NAMES, HEART, CLUB, SPADE)
+
+class OutsResult:
+    def __init__(self, current, cards, n_unseen, by_river=None, runner_runner=None, flush_suit=None,
+                 straight_nums=()):
+        self.current = current  # win type now
+        self.cards = cards  # {better win type: unseen cards that get you it on the next card}
+        self.counts = {category: len(category_cards) for category, category_cards in cards.items()}
+        self.next_card = {category: count / n_unseen for category, count in self.counts.items()}
+        # flop only: chance of finishing on each better win type by the river, and of getting there only with both
+        # turn & river (neither alone would do)
+        self.by_river = by_river
+        self.runner_runner = runner_runner
+        self.flush_suit = flush_suit  # suit you're one off a flush in, if any
+        self.straight_nums = straight_nums  # numbers that'd each fill a straight
+
+    def __str__(self):
+        lines = [f'{WIN_NAMES[self.current]} now']
+        for category in sorted(set(self.counts) | set(self.by_river or ()), reverse=True):
+            line = f'{WIN_NAMES[category]:>16}: {self.counts.get(category, 0):2} outs, ' \
+                   f'{self.next_card.get(category, 0):.3f} next card'
+            if self.by_river is not None:
+                line += f', {self.by_river.get(category, 0):.3f} by river ' \
+                        f'({self.runner_runner.get(category, 0):.3f} runner runner)'
+            lines.append(line)
+        return '\n'.join(lines)
+
+def outs(hand, board):
+    """for a flop (3) or turn (4) board, gives the unseen cards that move hand up to each better win type, with
+    their counts & chances on the next card, and on a flop the chances by the river incl. runner runner"""
+    if len(board) not in (3, 4):
+        raise ValueError(f'outs needs a flop or turn board (3 or 4 cards), not {len(board)}')
+    cards = [card.index for card in hand + board]
+    used_mask = cards_to_mask(hand + board)
+    unseen = [index for index in range(52) if not used_mask >> index & 1]
+    current = rank_category(evaluate(cards))
+
+    # next card
+    next_categories = {}
+    better_cards = {}
+    for index in unseen:
+        category = next_categories[index] = rank_category(evaluate(cards + [index]))
+        if category > current:
+            better_cards.setdefault(category, []).append(CARDS[index])
+
+    # turn & river, on the flop
+    by_river = runner_runner = None
+    if len(board) == 3:
+        by_river, runner_runner = {}, {}
+        for i, turn in enumerate(unseen):
+            turn_category = next_categories[turn]
+            for river in unseen[i + 1:]:
+                category = rank_category(evaluate(cards + [turn, river]))
+                if category > current:
+                    by_river[category] = by_river.get(category, 0) + 1
+                    if turn_category < category and next_categories[river] < category:
+                        runner_runner[category] = runner_runner.get(category, 0) + 1
+        n_runouts = len(unseen) * (len(unseen) - 1) // 2
+        by_river = {category: count / n_runouts for category, count in by_river.items()}
+        runner_runner = {category: count / n_runouts for category, count in runner_runner.items()}
+
+    # draws: 4 of a suit, and straights missing exactly 1 number
+    can_flush, flush_suit, _ = check_flush_potential(hand + board, min_suited=4)
+    numbers_mask = straight_numbers_mask(hand + board)
+    straight_nums = set()
+    for straight_start, window_mask in NUMBER_WINDOW_MASKS:
+        missing_mask = window_mask & ~numbers_mask
+        if missing_mask.bit_count() == 1:
+            straight_nums.add(missing_mask.bit_length() - 1 if missing_mask != 1 << 14 else 1)
+    return OutsResult(current, better_cards, len(unseen), by_river, runner_runner, flush_suit if can_flush else None,
+                      sorted(straight_nums))
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    print()
+    hand_test = [Card(8, SPADE), Card(10, HEART)]
+    table_test = [Card(9, HEART), Card(1, HEART), Card(11, CLUB), Card(8, HEART)]
+
+    for n_table in (3, 4):
+        start_time = datetime.datetime.now()
+        result = outs(hand_test, table_test[:n_table])
+        end_time = datetime.datetime.now()
+        print(result)
+        print(f'Flush draw in:            {SUIT_NAMES.get(result.flush_suit)}')
+        print(f'Straight numbers:         {result.straight_nums}')
+        print(f'Time for outs:            {end_time-start_time}\n')
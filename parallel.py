@@ -0,0 +1,69 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+import datetime
+import os
+
+import classes
+from classes import Card, hands_after_5, HEART, CLUB, SPADE
+import equity as equity_module
+
+class EvaluatorPool:
+    """persistent pool of worker processes, each loading the parent's lookup tables out of one shared memory block
+    as it starts. use as a context manager, or call close when done"""
+    def __init__(self, workers=None, start_method='spawn'):
+        self.workers = workers or os.cpu_count()
+        packed = classes.pack_tables(classes.FLUSH_RANK, classes.NONFLUSH_RANK, classes.RANK_ENCODED)
+        self.shared_tables = shared_memory.SharedMemory(create=True, size=len(packed))
+        self.shared_tables.buf[:len(packed)] = packed
+        # each worker loads the tables out of the block as it starts, instead of building its own (forked workers
+        # already have them, so it's a quick copy over the same tables)
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=get_context(start_method),
+                                            initializer=classes.use_shared_tables, initargs=(self.shared_tables.name,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.shared_tables.close()
+        self.shared_tables.unlink()
+
+    def equity(self, hand, board, n_opponents=1, **kwargs):
+        """equity.equity with its batches of deals spread over the workers, gives exactly the same result"""
+        return equity_module.equity(hand, board, n_opponents, executor=self.executor, **kwargs)
+
+    def hands_after_5(self, hands_and_tables, chunksize=16):
+        """classes.hands_after_5 for many (your_hand, table) pairs, spread over the workers, results in order"""
+        return list(self.executor.map(_hands_after_5, hands_and_tables, chunksize=chunksize))
+
+    def better_hands_after_5(self, hands_and_tables, chunksize=16):
+        """classes.better_hands_after_5 for many (your_hand, table) pairs, spread over the workers, results in order"""
+        return list(self.executor.map(_better_hands_after_5, hands_and_tables, chunksize=chunksize))
+
+def _hands_after_5(hand_and_table):
+    return hands_after_5(*hand_and_table)
+
+def _better_hands_after_5(hand_and_table):
+    return classes.better_hands_after_5(*hand_and_table)
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    print()
+    hand_test = [Card(8, SPADE), Card(10, HEART)]
+    table_test = [Card(3, HEART), Card(1, CLUB), Card(11, CLUB), Card(8, CLUB), Card(12, HEART)]
+
+    with EvaluatorPool() as pool:
+        for n_table in (0, 3, 4):
+            start_time = datetime.datetime.now()
+            serial = equity_module.equity(hand_test, table_test[:n_table], n_opponents=3, target_stderr=0.001)
+            middle_time = datetime.datetime.now()
+            parallel = pool.equity(hand_test, table_test[:n_table], n_opponents=3, target_stderr=0.001)
+            end_time = datetime.datetime.now()
+            print(f'{n_table} on table: {parallel}')
+            print(f'Same as serial?     {vars(serial) == vars(parallel)}')
+            print(f'Time serial:        {middle_time-start_time}')
+            print(f'Time parallel:      {end_time-middle_time}\n')
@@ -0,0 +1,191 @@
+import datetime
+import os
+import struct
+import sys
+
+import numpy as np
+
+from classes import Card, STRENGTH, SPADE, HEART, CLUB
+from batch import best5_batch
+from ranges import COMBOS, COMBO_CARDS, combos_overlap
+
+# the 169 starting hand classes live on a 13x13 grid, row & column being strengths from ace (0) down to 2 (12).
+# the diagonal is pairs, above it (row < column) suited, below it offsuit. class index is 13 * row + column
+N_CLASSES = 169
+STRENGTH_NAMES = 'AKQJT98765432'
+TABLE_MAGIC = b'PKEQ'
+TABLE_VERSION = 2  # bump whenever the layout, the evaluator's ranks or how equities are worked out change
+TABLE_HEADER = struct.Struct('<4sIII')  # magic, version, no. of classes, samples (random boards)
+# random boards both the saved table & live lookups go over, so they're equally precise (standard error ~0.0025)
+SAMPLES = 20000
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preflop_equity.bin')
+
+def hand_class(hand):
+    """gives the class index (0..168) of a 2 card hand"""
+    rows = sorted(12 - STRENGTH[card.index] for card in hand)
+    if hand[0].suit == hand[1].suit:
+        return 13 * rows[0] + rows[1]
+    return 13 * rows[1] + rows[0]
+
+def class_name(class_index):
+    """e.g. 'AA', 'AKs', 'T9o'"""
+    row, column = divmod(class_index, 13)
+    if row == column:
+        return STRENGTH_NAMES[row] * 2
+    if row < column:
+        return STRENGTH_NAMES[row] + STRENGTH_NAMES[column] + 's'
+    return STRENGTH_NAMES[column] + STRENGTH_NAMES[row] + 'o'
+
+def class_combos(class_index):
+    """every 2 card combo (pair of card indices, lower first) in a class: 6 for pairs, 4 suited, 12 offsuit"""
+    row, column = divmod(class_index, 13)
+    # strength row r is card number (12 - r) % 13 + 2, i.e. index (12 - r + 1) % 13 in a suit
+    first, second = (13 - row) % 13, (13 - column) % 13
+    combos = []
+    for first_suit in range(4):
+        for second_suit in range(4):
+            cards = (first + 13 * first_suit, second + 13 * second_suit)
+            if row == column and first_suit < second_suit or row < column and first_suit == second_suit or \
+                    row > column and first_suit != second_suit:
+                combos.append(tuple(sorted(cards)))
+    return combos
+
+RANK_SPAN = 1 << 13  # more than any rank, so ranks on different boards can be told apart as board * RANK_SPAN + rank
+# combo slots (as in ranges) of every class
+CLASS_SLOTS = [[second * (second - 1) // 2 + first for first, second in class_combos(class_index)]
+               for class_index in range(N_CLASSES)]
+
+"""BUILDING"""
+def class_equities(hero_classes, villain_classes, n_boards, rng, max_cells=1 << 22):
+    """matrix of the equity of each hero class (rows) against each villain class (columns), over n_boards random
+    boards. on each board every combo of the classes is ranked once, and each hero combo goes against every villain
+    combo that shares no card with it or the board, so every board counts for every matchup & every pair of combos.
+    boards are worked through in chunks that keep the biggest arrays under about max_cells"""
+    hero_slots = np.concatenate([CLASS_SLOTS[class_index] for class_index in hero_classes])
+    villain_slots = np.concatenate([CLASS_SLOTS[class_index] for class_index in villain_classes])
+    slots, slot_positions = np.unique(np.concatenate([hero_slots, villain_slots]), return_inverse=True)
+    hero_positions, villain_positions = slot_positions[:len(hero_slots)], slot_positions[len(hero_slots):]
+    hero_in, villain_in = _class_matrix(hero_classes), _class_matrix(villain_classes)
+    villain_columns = villain_in.argmax(axis=1)
+    n_hero, n_villain, n_columns = len(hero_slots), len(villain_slots), len(villain_classes)
+    overlap_hero, overlap_villain = np.nonzero(combos_overlap()[np.ix_(hero_slots, villain_slots)])
+
+    # won (2 per win, 1 per tie) & played by each hero combo against each villain class, counting every pair of
+    # combos at first, then taking out the pairs that share a card (which can't both be dealt)
+    won = np.zeros((n_hero, n_columns), dtype=np.int64)
+    played = np.zeros((n_hero, n_columns), dtype=np.int64)
+    overlap_won = np.zeros(len(overlap_hero), dtype=np.int64)
+    overlap_played = np.zeros(len(overlap_hero), dtype=np.int64)
+    chunk = max(1, max_cells // (n_villain * n_columns + len(overlap_hero)))
+    for start in range(0, n_boards, chunk):
+        n_chunk = min(chunk, n_boards - start)
+        boards = np.argpartition(rng.random((n_chunk, 52)), 5, axis=1)[:, :5]
+        # a combo's only live (& ranked) on the boards it doesn't share a card with, dead ones keep rank 0
+        live = ~COMBO_CARDS[slots][:, boards].any(axis=2).T
+        board_rows, slot_rows = np.nonzero(live)
+        ranks = np.zeros(live.shape, dtype=np.int64)
+        ranks[board_rows, slot_rows] = best5_batch(np.hstack([COMBOS[slots[slot_rows]], boards[board_rows]]))[0]
+        hero_ranks, hero_live = ranks[:, hero_positions], live[:, hero_positions]
+        villain_ranks, villain_live = ranks[:, villain_positions], live[:, villain_positions]
+
+        # villains sorted by board then rank (dead ones last on their board), with running counts of each class, so a
+        # hero combo's wins are the counts up to its rank. dead hero combos have rank 0, so they count nothing
+        offsets = np.arange(n_chunk)[:, None] * RANK_SPAN
+        keys = (np.where(villain_live, villain_ranks, RANK_SPAN - 1) + offsets).ravel()
+        order = np.argsort(keys, kind='stable')
+        counts = np.zeros((len(keys) + 1, n_columns), dtype=np.int64)
+        counts[np.arange(1, len(keys) + 1), villain_columns[order % n_villain]] = 1
+        counts = counts.cumsum(axis=0)
+        hero_keys = (hero_ranks + offsets).ravel()
+        board_starts = counts[np.repeat(np.arange(n_chunk) * n_villain, n_hero)]
+        doubled = counts[np.searchsorted(keys[order], hero_keys, 'left')] + \
+            counts[np.searchsorted(keys[order], hero_keys, 'right')] - 2 * board_starts
+        won += doubled.reshape(n_chunk, n_hero, n_columns).sum(axis=0)
+        played += hero_live.T.astype(np.int64) @ (villain_live.astype(np.int64) @ villain_in.astype(np.int64))
+
+        pair_hero_ranks, pair_villain_ranks = hero_ranks[:, overlap_hero], villain_ranks[:, overlap_villain]
+        pair_live = hero_live[:, overlap_hero] & villain_live[:, overlap_villain]
+        overlap_won += (((pair_hero_ranks > pair_villain_ranks).astype(np.int8) +
+                         (pair_hero_ranks >= pair_villain_ranks)) * pair_live).sum(axis=0)
+        overlap_played += pair_live.sum(axis=0)
+    np.subtract.at(won, (overlap_hero, villain_columns[overlap_villain]), overlap_won)
+    np.subtract.at(played, (overlap_hero, villain_columns[overlap_villain]), overlap_played)
+    return (hero_in.T @ won) / (2 * hero_in.T @ played)
+
+def _class_matrix(classes):
+    """0/1 matrix of which of classes (columns) each of their combos (rows, in order) is in, to add up combos by"""
+    columns = np.repeat(np.arange(len(classes)), [len(CLASS_SLOTS[class_index]) for class_index in classes])
+    return (columns[:, None] == np.arange(len(classes))).astype(np.float64)
+
+def build_table(samples=SAMPLES, seed=0):
+    """the 169x169 matrix of row class's equity against column class, heads up all in preflop, over samples random
+    boards (each used for every matchup)"""
+    classes = np.arange(N_CLASSES)
+    return class_equities(classes, classes, samples, np.random.default_rng(seed)).astype(np.float32)
+
+def save_table(table, samples, path=DEFAULT_TABLE_PATH):
+    """writes the header then the matrix as little endian float32, row by row"""
+    with open(path, 'wb') as file:
+        file.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, N_CLASSES, samples))
+        file.write(np.ascontiguousarray(table, dtype='<f4').tobytes())
+
+def load_table(path=DEFAULT_TABLE_PATH):
+    """memory maps a saved matrix, or gives None if the file's missing, not a table, or from another version"""
+    try:
+        with open(path, 'rb') as file:
+            magic, version, n_classes, samples = TABLE_HEADER.unpack(file.read(TABLE_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    expected_size = TABLE_HEADER.size + 4 * N_CLASSES * N_CLASSES
+    if magic != TABLE_MAGIC or version != TABLE_VERSION or n_classes != N_CLASSES or \
+            os.path.getsize(path) != expected_size:
+        return None
+    return np.memmap(path, dtype='<f4', mode='r', offset=TABLE_HEADER.size, shape=(N_CLASSES, N_CLASSES))
+
+"""LOOKUP"""
+class PreflopTable:
+    """heads up preflop equity by starting hand class. reads the saved table if there's a good one at path,
+    otherwise works each matchup out live (and remembers it)"""
+    def __init__(self, path=DEFAULT_TABLE_PATH, live_samples=SAMPLES, seed=0):
+        self.table = load_table(path)
+        self.live_samples = live_samples
+        self.rng = np.random.default_rng(seed)
+        self.live = {}
+
+    def class_equity(self, hero_class, villain_class):
+        """equity of hero_class against villain_class (class indices)"""
+        if self.table is not None:
+            return float(self.table[hero_class, villain_class])
+        if hero_class == villain_class:
+            return 0.5
+        if (villain_class, hero_class) in self.live:
+            return 1 - self.live[(villain_class, hero_class)]
+        if (hero_class, villain_class) not in self.live:
+            equities = class_equities([hero_class], [villain_class], self.live_samples, self.rng)
+            self.live[(hero_class, villain_class)] = float(equities[0, 0])
+        return self.live[(hero_class, villain_class)]
+
+    def equity(self, hand, villain_hand):
+        """equity of hand against villain_hand (2 cards each), going by their classes"""
+        return self.class_equity(hand_class(hand), hand_class(villain_hand))
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    # python preflop.py [samples (random boards)] [path] builds & saves the table
+    print()
+    build_samples = int(sys.argv[1]) if len(sys.argv) > 1 else SAMPLES
+    table_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_TABLE_PATH
+
+    start_time = datetime.datetime.now()
+    save_table(build_table(build_samples), build_samples, table_path)
+    end_time = datetime.datetime.now()
+    print(f'Time to build table:      {end_time-start_time}')
+
+    preflop = PreflopTable(table_path)
+    hand_test = [Card(1, SPADE), Card(13, SPADE)]
+    villain_test = [Card(12, HEART), Card(12, CLUB)]
+    print(f'Loaded from file?         {preflop.table is not None}')
+    print(f'{class_name(hand_class(hand_test))} vs {class_name(hand_class(villain_test))}:              '
+          f'{preflop.equity(hand_test, villain_test):.4f}')
+    print()
@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from functools import wraps
+import time
+
+# opt in instrumentation of the evaluator hot paths. while active is False, instrumented functions only pay for one
+# flag check per call. module level state on purpose (like the lookup tables in classes), so it's shared by every
+# module that's instrumented, without them having to pass anything around. counts aren't locked, so they can come
+# out slightly low when several threads are being profiled at once
+active = False
+calls = {}  # {function name: calls}
+times = {}  # {function name: total nanoseconds spent inside}
+histograms = {}  # {histogram name: {key: hits}}
+caches = {}  # {cache name: object with a stats() method}, read when a snapshot is taken
+
+def enable():
+    global active
+    active = True
+
+def disable():
+    global active
+    active = False
+
+def reset():
+    """clears everything counted so far (watched caches stay watched)"""
+    calls.clear()
+    times.clear()
+    histograms.clear()
+
+def profiled(function):
+    """decorator counting calls & time spent in function while profiling is active"""
+    name = function.__name__
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not active:
+            return function(*args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, start)
+    return wrapper
+
+def record(name, start):
+    """counts a call to name that started at start (time.perf_counter_ns). for the hottest functions, which check
+    active inline rather than pay for a profiled wrapper"""
+    times[name] = times.get(name, 0) + time.perf_counter_ns() - start
+    calls[name] = calls.get(name, 0) + 1
+
+def hit(histogram, key, n=1):
+    """adds n to key in histogram. callers check active first, so nothing's paid for this when it's off"""
+    counts = histograms.setdefault(histogram, {})
+    counts[key] = counts.get(key, 0) + n
+
+def watch_cache(name, cache):
+    """includes cache.stats() (e.g. of a canonical.LRUCache) in snapshots under name"""
+    caches[name] = cache
+
+def snapshot():
+    """everything counted so far as plain dicts, ready to dump as JSON or push to a metrics pipeline"""
+    return {'functions': {name: {'calls': n_calls, 'total_s': times[name] / 1e9,
+                                 'mean_us': times[name] / n_calls / 1000} for name, n_calls in calls.items()},
+            'histograms': {name: dict(counts) for name, counts in histograms.items()},
+            'caches': {name: cache.stats() for name, cache in caches.items()}}
+
+@contextmanager
+def profile(clear=True):
+    """turns profiling on inside the with block (clearing old counts first unless clear is False), and fills the dict
+    it gives with the snapshot on the way out"""
+    if clear:
+        reset()
+    was_active = active
+    enable()
+    report = {}
+    try:
+        yield report
+    finally:
+        if not was_active:
+            disable()
+        report.update(snapshot())
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    import json
+    # the instrumented modules count into the imported profiling module, not this __main__ copy of it
+    from profiling import profile
+    from classes import Card, best5, better_hands_after_5, HEART, CLUB, SPADE
+    from canonical import CanonicalCache
+
+    hand_test = [Card(8, SPADE), Card(10, HEART)]
+    table_test = [Card(3, HEART), Card(1, CLUB), Card(11, CLUB), Card(8, CLUB), Card(12, HEART)]
+    cache = CanonicalCache(name='canonical')
+    with profile() as report:
+        best5(hand_test, table_test)
+        better_hands_after_5(hand_test, table_test)
+        better_hands_after_5(hand_test, table_test, legacy=True)
+        cache.hands_after_5(hand_test, table_test)
+        cache.hands_after_5(hand_test, table_test)
+    print(json.dumps(report, indent=2))
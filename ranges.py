@@ -0,0 +1,224 @@
+from itertools import combinations
+from math import comb, sqrt
+import datetime
+import re
+
+import numpy as np
+
+from classes import Card, CARDS, HEART, CLUB, SPADE, DIAM
+from batch import best5_batch
+
+# every 2 card combo gets a slot 0..1325: combo (first, second) of card indices, first < second, is at
+# second * (second - 1) / 2 + first
+N_COMBOS = 1326
+COMBOS = np.array([(first, second) for second in range(52) for first in range(second)], dtype=np.int64)
+COMBO_CARDS = np.zeros((N_COMBOS, 52), dtype=bool)  # which cards are in each combo
+COMBO_CARDS[np.arange(N_COMBOS)[:, None], COMBOS] = True
+STRENGTH_CHARS = '23456789TJQKA'
+SUIT_CHARS = {'d': DIAM, 'c': CLUB, 'h': HEART, 's': SPADE}
+_overlaps = None
+
+def combo_index(first, second):
+    """slot of a 2 card combo (cards, either order)"""
+    first, second = sorted((first.index, second.index))
+    return second * (second - 1) // 2 + first
+
+def combos_overlap():
+    """(1326, 1326) bool matrix of which combos share a card, built on first use"""
+    global _overlaps
+    if _overlaps is None:
+        _overlaps = (COMBO_CARDS.astype(np.float32) @ COMBO_CARDS.T.astype(np.float32)) > 0
+    return _overlaps
+
+def _index(strength, suit):
+    """card index of a strength (0..12 for 2..ace) & suit"""
+    return (strength + 1) % 13 + 13 * suit
+
+class Range:
+    """weights (0 to 1, or anything non-negative) on each of the 1326 combos"""
+    def __init__(self, weights=None):
+        self.weights = np.zeros(N_COMBOS) if weights is None else np.asarray(weights, dtype=float)
+
+    def __str__(self):
+        return f'range of {np.count_nonzero(self.weights)} combos, total weight {self.weights.sum():.2f}'
+
+    @classmethod
+    def parse(cls, text):
+        """standard notation, comma separated: pairs 'QQ', 'QQ+', '22-55', suited/offsuit/both 'AKs', 'AKo', 'AK',
+        'ATs+' (kicker up to one under), 'T9s-54s' or 'A2s-A5s' (runs), exact combos 'AhKh'. ':weight' after any of
+        them sets its weight, as a fraction or percent, e.g. 'QQ+, AKs, T9s-54s:40%'"""
+        weights = np.zeros(N_COMBOS)
+        for token in text.replace(' ', '').split(','):
+            if not token:
+                continue
+            token, _, weight = token.partition(':')
+            weight = float(weight[:-1]) / 100 if weight.endswith('%') else float(weight or 1)
+            if not weight >= 0:
+                raise ValueError(f'range token {token!r} has to have a non-negative weight')
+            for first, second in _parse_token(token):
+                weights[second * (second - 1) // 2 + first] = weight
+        return cls(weights)
+
+    @classmethod
+    def from_hands(cls, hands):
+        """weight 1 on each 2 card hand given"""
+        weights = np.zeros(N_COMBOS)
+        for hand in hands:
+            weights[combo_index(*hand)] = 1.0
+        return cls(weights)
+
+    def without(self, cards):
+        """copy with every combo that uses any of cards (board, dead cards, your hand) taken out"""
+        dead = np.zeros(52, dtype=bool)
+        dead[[card.index for card in cards]] = True
+        return Range(np.where(COMBO_CARDS[:, dead].any(axis=1), 0.0, self.weights))
+
+    def normalised(self):
+        """copy with weights adding up to 1"""
+        total = self.weights.sum()
+        return Range(self.weights / total if total else self.weights)
+
+    def hands(self):
+        """(card, card, weight) for each combo with weight"""
+        return [(CARDS[COMBOS[slot, 0]], CARDS[COMBOS[slot, 1]], self.weights[slot])
+                for slot in np.flatnonzero(self.weights)]
+
+def _parse_token(token):
+    """card index pairs (lower first) for one bit of range notation"""
+    if re.fullmatch(r'([2-9TJQKA][dchs]){2}', token):
+        first, second = (_index(STRENGTH_CHARS.index(token[i]), SUIT_CHARS[token[i + 1]]) for i in (0, 2))
+        if first == second:
+            raise ValueError(f'range token {token!r} has the same card twice')
+        return [tuple(sorted((first, second)))]
+    match = re.fullmatch(r'([2-9TJQKA])([2-9TJQKA])([so]?)(\+?)(?:-([2-9TJQKA])([2-9TJQKA])\3)?', token)
+    if not match:
+        raise ValueError(f'can\'t read range token {token!r}')
+    high, low, suitedness, plus, end_high, end_low = match.groups()
+    high, low = STRENGTH_CHARS.index(high), STRENGTH_CHARS.index(low)
+    if high < low:
+        high, low = low, high
+    if plus:
+        # pairs go up to aces, others keep the top card and take the kicker up to one under it
+        shapes = [(strength, strength) for strength in range(high, 13)] if high == low else \
+            [(high, kicker) for kicker in range(low, high)]
+    elif end_high:
+        end_high, end_low = sorted((STRENGTH_CHARS.index(end_high), STRENGTH_CHARS.index(end_low)), reverse=True)
+        if high != end_high and high - low != end_high - end_low:
+            raise ValueError(f'range token {token!r} has to keep the same gap between its cards from end to end')
+        # a run steps every changing card together from one end to the other
+        steps = range(min(high, end_high) - max(high, end_high), 1) if high != end_high else \
+            range(min(low, end_low) - max(low, end_low), 1)
+        top_high, top_low = max((high, low), (end_high, end_low))
+        shapes = [(top_high + step if high != end_high else top_high, top_low + step) for step in steps]
+    else:
+        shapes = [(high, low)]
+
+    pairs = []
+    for shape_high, shape_low in shapes:
+        for high_suit in range(4):
+            for low_suit in range(4):
+                if shape_high == shape_low and high_suit >= low_suit or suitedness == 's' and high_suit != low_suit or \
+                        suitedness == 'o' and high_suit == low_suit:
+                    continue
+                pairs.append(tuple(sorted((_index(shape_high, high_suit), _index(shape_low, low_suit)))))
+    return pairs
+
+"""EQUITY"""
+class RangeEquityResult:
+    def __init__(self, won, played, exhaustive):
+        # won & played are arrays of the weight won (ties as half) & weight played on each runout
+        total_played = played.sum()
+        self.equity = won.sum() / total_played if total_played else 0.0
+        self.runouts = len(played)
+        # standard error of the ratio of sums over sampled runouts, 0 if every runout was enumerated
+        if exhaustive or self.runouts < 2 or not total_played:
+            self.stderr = 0.0
+        else:
+            residuals = won - self.equity * played
+            self.stderr = sqrt((residuals ** 2).sum() / (self.runouts * (self.runouts - 1))) / played.mean()
+        self.exhaustive = exhaustive
+
+    def __str__(self):
+        how = 'exhaustive' if self.exhaustive else f'stderr {self.stderr:.4f}'
+        return f'equity {self.equity:.4f} over {self.runouts} runouts ({how})'
+
+def range_vs_range(range_a, range_b, board, seed=0, target_stderr=0.002, max_runouts=100000, exhaustive_limit=1200,
+                   max_cells=1 << 22):
+    """equity of range_a against range_b (by weight, card removal counted) with 0, 3, 4 or 5 board cards out, as a
+    RangeEquityResult. every runout is enumerated if there are at most exhaustive_limit of them, otherwise runouts
+    are sampled (seeded) in batches until the standard error gets down to target_stderr or max_runouts is hit.
+    batches are as many runouts as keep the runout x combo x combo arrays under about max_cells"""
+    if len(board) not in (0, 3, 4, 5):
+        raise ValueError(f'board has to have 0, 3, 4 or 5 cards, not {len(board)}')
+    board_indices = [card.index for card in board]
+    range_a, range_b = range_a.without(board), range_b.without(board)
+    slots_a, slots_b = np.flatnonzero(range_a.weights), np.flatnonzero(range_b.weights)
+    weights_a, weights_b = range_a.weights[slots_a], range_b.weights[slots_b]
+    both_live = ~combos_overlap()[np.ix_(slots_a, slots_b)]
+    slots = np.union1d(slots_a, slots_b)
+    positions_a, positions_b = np.searchsorted(slots, slots_a), np.searchsorted(slots, slots_b)
+
+    deck = np.array([index for index in range(52) if index not in board_indices], dtype=np.int64)
+    n_missing = 5 - len(board)
+    batch_size = max(1, min(1000, max_cells // max(1, both_live.size)))
+    won, played = [], []
+    exhaustive = comb(len(deck), n_missing) <= exhaustive_limit
+    if exhaustive:
+        all_runouts = list(combinations(deck, n_missing))
+        all_runouts = np.array(all_runouts, dtype=np.int64).reshape(len(all_runouts), n_missing)
+        batches = (all_runouts[start:start + batch_size] for start in range(0, len(all_runouts), batch_size))
+    else:
+        rng = np.random.default_rng(seed)
+        batches = (deck[np.argpartition(rng.random((min(batch_size, max_runouts - drawn), len(deck))), n_missing,
+                                        axis=1)[:, :n_missing]] for drawn in range(0, max_runouts, batch_size))
+    for runouts in batches:
+        # combos using a runout card can't have been dealt with it, they get no weight & aren't ranked
+        live = ~COMBO_CARDS[slots][:, runouts].any(axis=2).T
+        runout_rows, slot_rows = np.nonzero(live)
+        full_boards = np.hstack([np.tile(board_indices, (len(runouts), 1)), runouts])
+        ranks = np.zeros(live.shape, dtype=np.int64)
+        ranks[runout_rows, slot_rows] = best5_batch(np.hstack([COMBOS[slots[slot_rows]], full_boards[runout_rows]]))[0]
+        ranks_a, ranks_b = ranks[:, positions_a, None], ranks[:, None, positions_b]
+        live_a, live_b = weights_a * live[:, positions_a], weights_b * live[:, positions_b]
+        scores = ((ranks_a > ranks_b) + 0.5 * (ranks_a == ranks_b)) * both_live
+        won.append(np.einsum('ra,rab,rb->r', live_a, scores, live_b))
+        played.append(np.einsum('ra,ab,rb->r', live_a, both_live.astype(float), live_b))
+        if not exhaustive and \
+                RangeEquityResult(np.concatenate(won), np.concatenate(played), False).stderr <= target_stderr:
+            break
+    return RangeEquityResult(np.concatenate(won), np.concatenate(played), exhaustive)
+
+def hand_vs_range(hand, villain_range, board, **kwargs):
+    """equity of a 2 card hand against a range, same as range_vs_range with a one combo range"""
+    return range_vs_range(Range.from_hands([hand]), villain_range, board, **kwargs)
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    print()
+    hand_test = [Card(8, SPADE), Card(10, HEART)]
+    table_test = [Card(3, HEART), Card(1, CLUB), Card(11, CLUB), Card(8, CLUB), Card(12, HEART)]
+    villain_test = Range.parse('QQ+, AKs, AJo+, T9s-54s:40%, 88-66')
+    print(f'Villain:                  {villain_test}')
+
+    start_time = datetime.datetime.now()
+    hand_equity = hand_vs_range(hand_test, villain_test, table_test)
+    end_time = datetime.datetime.now()
+    print(f'Hand vs range on river:   {hand_equity} in {end_time-start_time}')
+
+    hero_test = Range.parse('TT+, AQs+, KQs, 98s-65s')
+    start_time = datetime.datetime.now()
+    range_equity = range_vs_range(hero_test, villain_test, table_test)
+    end_time = datetime.datetime.now()
+    print(f'Range vs range on river:  {range_equity} in {end_time-start_time}')
+
+    start_time = datetime.datetime.now()
+    range_equity = range_vs_range(hero_test, villain_test, table_test[:4])
+    end_time = datetime.datetime.now()
+    print(f'Range vs range on turn:   {range_equity} in {end_time-start_time}')
+
+    start_time = datetime.datetime.now()
+    range_equity = range_vs_range(Range.parse('AA'), Range.parse('KK'), [])
+    end_time = datetime.datetime.now()
+    print(f'AA vs KK preflop:         {range_equity} in {end_time-start_time}')
+    print()
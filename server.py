@@ -0,0 +1,405 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from classes import CARDS, rank_category, rank_strengths, WIN_NAMES
+from batch import best5_batch
+from equity import equity
+from parallel import EvaluatorPool
+from ranges import COMBOS, COMBO_CARDS
+from stream import parse_cards, CARD_TEXT
+from utils import summarise
+
+# line protocol: a JSON object per line each way. requests are {"id": anything, "op": ..., ...} with cards written
+# back to back as in stream.py, e.g. "hand": "AhKd", "board": "2c7s9dTs3h". ops:
+#   best5         hand, 5 card board      -> {"rank", "category", "strengths"}
+#   better_hands  hand, 5 card board      -> {"better", "tied", "worse"} counts of the 990 opponent hands
+#   equity        hand, 0/3/4/5 board, optional n_opponents (1-22), seed, target_stderr (>= 0.001),
+#                 max_deals (<= 200000, only enumerating every deal if there are no more) -> EquityResult fields
+#   stats         nothing                 -> the server's latency & batching stats, answered straight away
+# responses are {"id", "ok": true, "result"} or {"id", "ok": false, "error"}
+OPS = ('best5', 'better_hands', 'equity')
+EQUITY_OPTIONS = ('n_opponents', 'seed', 'target_stderr', 'max_deals')
+MAX_OPPONENTS = 22  # as many as a deck can deal to, with 5 board cards
+MAX_DEALS = 200000
+MIN_TARGET_STDERR = 0.001
+N_OPPONENT_HANDS = 990  # 2 card hands left once 7 cards are known
+
+def parse_request(line):
+    """(id, op, item) from a request line, item being (hand indices, board indices, equity options).
+    raises ValueError for anything that can't be evaluated"""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as error:
+        raise ValueError(f'bad JSON: {error}') from None
+    if not isinstance(request, dict):
+        raise ValueError('request has to be a JSON object')
+    op = request.get('op')
+    if op not in OPS and op != 'stats':
+        raise ValueError(f'unknown op {op!r}')
+    if op == 'stats':
+        return request.get('id'), op, None
+    try:
+        hand, board = parse_cards(request['hand']), parse_cards(request.get('board', ''))
+    except (KeyError, TypeError):
+        raise ValueError('hand & board have to be cards like "AhKd"') from None
+    if len(hand) != 2 or len(set(hand + board)) != len(hand + board):
+        raise ValueError('needs 2 cards in hand and no card twice')
+    if len(board) not in ((0, 3, 4, 5) if op == 'equity' else (5,)):
+        raise ValueError(f'{op} can\'t take a {len(board)} card board')
+    return request.get('id'), op, (hand, board, _equity_options(request) if op == 'equity' else {})
+
+def _equity_options(request):
+    """equity's keyword arguments from a request, checked & capped so no one request can run for long"""
+    options = {}
+    for name in EQUITY_OPTIONS:
+        if name in request:
+            value = request[name]
+            if isinstance(value, bool) or not isinstance(value, (int, float) if name == 'target_stderr' else int):
+                raise ValueError(f'{name} has to be {"a number" if name == "target_stderr" else "an integer"}')
+            options[name] = value
+    if not 1 <= options.get('n_opponents', 1) <= MAX_OPPONENTS:
+        raise ValueError(f'n_opponents has to be 1 to {MAX_OPPONENTS}')
+    if not 1 <= options.setdefault('max_deals', MAX_DEALS) <= MAX_DEALS:
+        raise ValueError(f'max_deals has to be 1 to {MAX_DEALS}')
+    if not MIN_TARGET_STDERR <= options.get('target_stderr', MIN_TARGET_STDERR) <= 1:
+        raise ValueError(f'target_stderr has to be {MIN_TARGET_STDERR} to 1')
+    # enumerating every deal doesn't stop at max_deals, so it's only allowed up to that many
+    options['exhaustive_limit'] = options['max_deals']
+    return options
+
+def _request_id(line):
+    """id of a request that failed parse_request, if it got as far as having one"""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    return request.get('id') if isinstance(request, dict) else None
+
+"""EVALUATING"""
+def evaluate_batch(op, items):
+    """results (JSON ready) for a batch of items of one op, with the exception in place of the result for any item
+    that fails. best5 & better_hands rank the whole batch in one best5_batch call (going item by item if that fails,
+    so a bad item only fails itself), equity goes item by item"""
+    if op == 'equity':
+        results = []
+        for hand, board, options in items:
+            try:
+                results.append(vars(equity([CARDS[index] for index in hand], [CARDS[index] for index in board],
+                                           **options)))
+            except Exception as error:
+                results.append(error)
+        return results
+    try:
+        return _rank_batch(op, items)
+    except Exception as error:
+        if len(items) == 1:
+            return [error]
+        return [evaluate_batch(op, [item])[0] for item in items]
+
+def _rank_batch(op, items):
+    if op == 'best5':
+        ranks = best5_batch(np.array([hand + board for hand, board, options in items], dtype=np.int64))[0].tolist()
+        return [{'rank': rank, 'category': WIN_NAMES[rank_category(rank)],
+                 'strengths': rank_strengths(rank)} for rank in ranks]
+    # every item's 990 opponent hands (combos not using its cards) against its board, then the item's own hand
+    rows = np.concatenate([np.hstack([np.vstack([COMBOS[~COMBO_CARDS[:, hand + board].any(axis=1)], [hand]]),
+                                      np.tile(board, (N_OPPONENT_HANDS + 1, 1))])
+                           for hand, board, options in items])
+    results = []
+    for item_ranks in best5_batch(rows)[0].reshape(len(items), N_OPPONENT_HANDS + 1):
+        opponent_ranks, your_rank = item_ranks[:N_OPPONENT_HANDS], item_ranks[N_OPPONENT_HANDS]
+        results.append({'better': int((opponent_ranks > your_rank).sum()),
+                        'tied': int((opponent_ranks == your_rank).sum()),
+                        'worse': int((opponent_ranks < your_rank).sum())})
+    return results
+
+def _settle(future, result):
+    """gives a request's future its result from evaluate_batch, which is an exception if the item failed"""
+    if isinstance(result, Exception):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+class EvaluationServer:
+    """micro-batching evaluation server. requests wait at most window seconds (or until max_batch are waiting) and
+    then get evaluated together. at most max_pending requests can be waiting, after which connections stop being
+    read (backpressure down to the clients' sockets). with workers, batches are split over an EvaluatorPool.
+    equity requests can take seconds each, so they queue & run one by one apart from the batches, and never hold up
+    best5 & better_hands"""
+    def __init__(self, window=0.002, max_batch=256, max_pending=4096, workers=0, latency_history=100000):
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = asyncio.Queue(max_pending)
+        self.equity_pending = asyncio.Queue(max_pending)
+        self.pool = EvaluatorPool(workers) if workers else None
+        # batches being evaluated at once: one per worker, or one at a time off the event loop
+        self.batch_slots = asyncio.Semaphore(workers or 1)
+        # equity runs on workers of its own (half as many again), or on a thread of its own next to the batch one,
+        # as anything sharing the batches' workers can end up queued behind a long equity request
+        self.equity_pool = EvaluatorPool(max(workers // 2, 1)) if workers else None
+        self.equity_executor = self.equity_pool.executor if workers else ThreadPoolExecutor(1)
+        self.equity_slots = asyncio.Semaphore(max(workers // 2, 1))
+        self.tasks = set()  # batches & equity requests being evaluated, as the event loop only keeps weak references
+        self.latencies = deque(maxlen=latency_history)  # nanoseconds, from request read to response ready
+        self.n_requests = self.n_batches = self.n_errors = 0
+        self.server = self.batcher = self.equity_runner = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        """starts listening (port 0 picks a free one), gives the port"""
+        self.batcher = asyncio.create_task(self._batch_loop())
+        self.equity_runner = asyncio.create_task(self._equity_loop())
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for task in [self.batcher, self.equity_runner, *self.tasks]:
+            task.cancel()
+        await asyncio.gather(self.batcher, self.equity_runner, *self.tasks, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.close()
+            self.equity_pool.close()
+        else:
+            self.equity_executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        latency = summarise(self.latencies) if self.latencies else {}
+        return {'requests': self.n_requests, 'errors': self.n_errors, 'batches': self.n_batches,
+                'mean_batch': self.n_requests / self.n_batches if self.n_batches else 0.0,
+                'waiting': self.pending.qsize() + self.equity_pending.qsize(),
+                'p50_ms': latency.get('p50_us', 0) / 1000, 'p99_ms': latency.get('p99_us', 0) / 1000}
+
+    async def _handle_connection(self, reader, writer):
+        replies = set()
+        try:
+            while line := await reader.readline():
+                start = time.perf_counter_ns()
+                try:
+                    request_id, op, item = parse_request(line)
+                except ValueError as error:
+                    self.n_errors += 1
+                    await self._reply(writer, {'id': _request_id(line), 'ok': False, 'error': str(error)})
+                    continue
+                if op == 'stats':
+                    await self._reply(writer, {'id': request_id, 'ok': True, 'result': self.stats()})
+                    continue
+                future = asyncio.get_running_loop().create_future()
+                # waits here when the server's full
+                await (self.equity_pending if op == 'equity' else self.pending).put((op, item, future))
+                reply = asyncio.create_task(self._reply_when_done(writer, request_id, future, start))
+                replies.add(reply)
+                reply.add_done_callback(replies.discard)
+            await asyncio.gather(*replies)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _reply_when_done(self, writer, request_id, future, start):
+        try:
+            response = {'id': request_id, 'ok': True, 'result': await future}
+        except Exception as error:
+            self.n_errors += 1
+            response = {'id': request_id, 'ok': False, 'error': str(error)}
+        self.latencies.append(time.perf_counter_ns() - start)
+        self.n_requests += 1
+        await self._reply(writer, response)
+
+    @staticmethod
+    async def _reply(writer, response):
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+
+    def _start_task(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.pending.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(await asyncio.wait_for(self.pending.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            await self.batch_slots.acquire()
+            self._start_task(self._run_batch(batch))
+            self.n_batches += 1
+
+    async def _equity_loop(self):
+        while True:
+            op, item, future = await self.equity_pending.get()
+            await self.equity_slots.acquire()
+            self._start_task(self._run_equity(item, future))
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            by_op = {}
+            for op, item, future in batch:
+                by_op.setdefault(op, []).append((item, future))
+            # cheapest ops first, so their answers don't wait on slower ones in the same batch
+            for op, entries in sorted(by_op.items(), key=lambda op_entries: OPS.index(op_entries[0])):
+                items = [item for item, future in entries]
+                try:
+                    if self.pool is None:
+                        results = await loop.run_in_executor(None, evaluate_batch, op, items)
+                    else:
+                        n_chunks = min(self.pool.workers, len(items))
+                        chunks = [items[i::n_chunks] for i in range(n_chunks)]
+                        chunk_results = await asyncio.gather(*(loop.run_in_executor(self.pool.executor, evaluate_batch,
+                                                                                    op, chunk) for chunk in chunks))
+                        # chunks were dealt round robin, so deal the results back the same way
+                        results = [chunk_results[i % n_chunks][i // n_chunks] for i in range(len(items))]
+                except Exception as error:
+                    # evaluate_batch gives failed items their own exceptions, so this is the executor itself failing
+                    results = [error] * len(entries)
+                for (item, future), result in zip(entries, results):
+                    _settle(future, result)
+        finally:
+            self.batch_slots.release()
+
+    async def _run_equity(self, item, future):
+        loop = asyncio.get_running_loop()
+        try:
+            result = (await loop.run_in_executor(self.equity_executor, evaluate_batch, 'equity', [item]))[0]
+        except Exception as error:
+            result = error
+        finally:
+            self.equity_slots.release()
+        _settle(future, result)
+
+"""CLIENT & LOAD"""
+class EvaluationClient:
+    """loopback client. requests can be sent concurrently over the one connection, responses are matched up by id"""
+    def __init__(self):
+        self.reader = self.writer = self.listener = None
+        self.waiting = {}
+        self.next_id = 0
+
+    async def connect(self, host='127.0.0.1', port=8765):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.listener
+
+    async def request(self, op, **fields):
+        """sends a request & waits for its result, raising ValueError if the server answers with an error"""
+        request_id = self.next_id
+        self.next_id += 1
+        future = self.waiting[request_id] = asyncio.get_running_loop().create_future()
+        self.writer.write(json.dumps({'id': request_id, 'op': op, **fields}).encode() + b'\n')
+        await self.writer.drain()
+        response = await future
+        if not response['ok']:
+            raise ValueError(response['error'])
+        return response['result']
+
+    async def _listen(self):
+        while line := await self.reader.readline():
+            response = json.loads(line)
+            future = self.waiting.pop(response['id'], None)
+            if future is not None:
+                future.set_result(response)
+
+def random_request(rng, mix):
+    """a random request, op picked by mix ({op: weight})"""
+    op = rng.choices(list(mix), list(mix.values()))[0]
+    n_board = rng.choice((0, 3, 4, 5)) if op == 'equity' else 5
+    deal = [CARD_TEXT[index] for index in rng.sample(range(52), 2 + n_board)]
+    fields = {'hand': ''.join(deal[:2]), 'board': ''.join(deal[2:])}
+    if op == 'equity':
+        fields.update(target_stderr=0.01, max_deals=5000)
+    return op, fields
+
+async def run_load(host, port, n_clients=32, n_requests=2000, mix=None, seed=0):
+    """n_clients connections each firing off requests one after another until n_requests are answered between them.
+    gives client side latency stats (as utils.summarise) and the server's own stats"""
+    mix = mix or {'best5': 0.8, 'better_hands': 0.15, 'equity': 0.05}
+    rng = random.Random(seed)
+    requests = [random_request(rng, mix) for _ in range(n_requests)]
+    latencies = []
+
+    async def client_loop(client_num):
+        client = EvaluationClient()
+        await client.connect(host, port)
+        for op, fields in requests[client_num::n_clients]:
+            start = time.perf_counter_ns()
+            await client.request(op, **fields)
+            latencies.append(time.perf_counter_ns() - start)
+        await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(client_num) for client_num in range(n_clients)))
+    elapsed = time.perf_counter() - start
+    stats_client = EvaluationClient()
+    await stats_client.connect(host, port)
+    server_stats = await stats_client.request('stats')
+    await stats_client.close()
+    return {**summarise(latencies), 'throughput_per_s': n_requests / elapsed}, server_stats
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+async def serve(args):
+    server = EvaluationServer(args.window_ms / 1000, args.max_batch, args.max_pending, args.workers)
+    port = await server.start(args.host, args.port)
+    print(f'Serving on {args.host}:{port}', file=sys.stderr)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+async def load(args):
+    mix = {op: float(weight) for op, weight in (part.split('=') for part in args.mix.split(','))}
+    server = None
+    port = args.port
+    if not port:
+        # no server given, so run one in process on loopback
+        server = EvaluationServer(args.window_ms / 1000, args.max_batch, args.max_pending, args.workers)
+        port = await server.start(args.host)
+    try:
+        client_stats, server_stats = await run_load(args.host, port, args.clients, args.requests, mix)
+    finally:
+        if server is not None:
+            await server.close()
+    print(f'Client:  p50 {client_stats["p50_us"] / 1000:.2f} ms, p99 {client_stats["p99_us"] / 1000:.2f} ms, '
+          f'{client_stats["throughput_per_s"]:.0f} requests/s')
+    print(f'Server:  {server_stats}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='asyncio evaluation server with micro-batching, and a load generator')
+    parser.add_argument('mode', choices=('serve', 'load'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='to serve on, or to load (0 runs a server in process)')
+    parser.add_argument('--window-ms', type=float, default=2.0, help='longest a request waits to be batched')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-pending', type=int, default=4096, help='waiting requests before backpressure')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='processes to spread batches over (plus half as many for equity), 0 for none')
+    parser.add_argument('--clients', type=int, default=32, help='load: concurrent connections')
+    parser.add_argument('--requests', type=int, default=2000, help='load: total requests')
+    parser.add_argument('--mix', default='best5=0.8,better_hands=0.15,equity=0.05', help='load: op weights')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args) if args.mode == 'serve' else load(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
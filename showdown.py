@@ -0,0 +1,99 @@
+import datetime
+
+from classes import Card, cards_to_mask, evaluate, HEART, CLUB, SPADE, DIAM
+
+class ShowdownResult:
+    def __init__(self, ranks, finish, pot_winners, winnings):
+        self.ranks = ranks  # rank (as from evaluate) per player, None for anyone folded
+        self.finish = finish  # groups of players (positions) with exactly tied hands, best group first
+        self.pot_winners = pot_winners  # positions splitting each pot, in the order pots were given
+        self.winnings = winnings  # total won per player
+
+    def __str__(self):
+        return f'finish {self.finish}, pot winners {self.pot_winners}, winnings {self.winnings}'
+
+def side_pots(contributions, folded=()):
+    """builds main & side pots, as resolve_showdown takes them, from what each player put in. a pot is made per
+    all-in level, folded players' chips go in but they can't win any of it"""
+    levels = sorted({amount for position, amount in enumerate(contributions) if position not in folded and amount})
+    pots = []
+    below = 0
+    for level in levels:
+        amount = sum(min(contribution, level) - min(contribution, below) for contribution in contributions)
+        eligible = [position for position, contribution in enumerate(contributions)
+                    if position not in folded and contribution >= level]
+        if pots and pots[-1][1] == eligible:
+            pots[-1] = (pots[-1][0] + amount, eligible)  # only folded players' chips made this level
+        else:
+            pots.append((amount, eligible))
+        below = level
+    # anything folded players put in above the last live level goes to the top pot
+    extra = sum(contribution - min(contribution, below) for contribution in contributions)
+    if extra and pots:
+        pots[-1] = (pots[-1][0] + extra, pots[-1][1])
+    return pots
+
+def resolve_showdown(players, board, pots):
+    """players: each player's 2 card hand (None if folded), board: the 5 table cards, pots: (amount, eligible
+    positions) per pot, main pot first (see side_pots). ranks every live player once, then each pot goes to its best
+    eligible hand, split evenly on exact ties. integer amounts split in whole chips, with odd chips to the tied
+    players earliest in players"""
+    if len(board) != 5:
+        raise ValueError(f'showdown needs a 5 card board, not {len(board)}')
+    board_indices = [card.index for card in board]
+    used_mask = cards_to_mask(board)
+    ranks = []
+    for position, hand in enumerate(players):
+        if hand is None:
+            ranks.append(None)
+            continue
+        hand_mask = cards_to_mask(hand)
+        if len(hand) != 2 or hand_mask.bit_count() != 2 or used_mask & hand_mask:
+            raise ValueError(f'player {position} needs 2 cards not used anywhere else')
+        used_mask |= hand_mask
+        ranks.append(evaluate([hand[0].index, hand[1].index] + board_indices))
+
+    by_rank = {}
+    for position, rank in enumerate(ranks):
+        if rank is not None:
+            by_rank.setdefault(rank, []).append(position)
+    finish = [by_rank[rank] for rank in sorted(by_rank, reverse=True)]
+
+    winnings = [0] * len(players)
+    pot_winners = []
+    for amount, eligible in pots:
+        live = [position for position in eligible if ranks[position] is not None]
+        if not live:
+            raise ValueError(f'pot of {amount} has nobody left to win it')
+        best = max(ranks[position] for position in live)
+        winners = [position for position in live if ranks[position] == best]
+        if isinstance(amount, int):
+            share, odd_chips = divmod(amount, len(winners))
+        else:
+            share, odd_chips = amount / len(winners), 0
+        for i, position in enumerate(sorted(winners)):
+            winnings[position] += share + (i < odd_chips)
+        pot_winners.append(winners)
+    return ShowdownResult(ranks, finish, pot_winners, winnings)
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+if __name__ == '__main__':
+    print()
+    table_test = [Card(3, HEART), Card(1, CLUB), Card(11, CLUB), Card(8, CLUB), Card(12, HEART)]
+    players_test = [[Card(8, SPADE), Card(10, HEART)],   # pair of 8s
+                    [Card(13, CLUB), Card(2, CLUB)],     # flush
+                    [Card(8, DIAM), Card(10, DIAM)],     # same pair of 8s as the first
+                    [Card(1, SPADE), Card(4, HEART)],    # folded
+                    [Card(8, HEART), Card(10, SPADE)]]   # same again, all in short
+    contributions_test = [100, 40, 100, 30, 20]
+    pots_test = side_pots(contributions_test, folded={3})
+    print(f'Pots:                     {pots_test}')
+
+    start_time = datetime.datetime.now()
+    result = resolve_showdown(players_test[:3] + [None] + players_test[4:], table_test, pots_test)
+    end_time = datetime.datetime.now()
+    print(f'{result}')
+    print(f'Chips all handed out?     {sum(result.winnings) == sum(contributions_test)}')
+    print(f'Time for showdown:        {end_time-start_time}')
+    print()
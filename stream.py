@@ -0,0 +1,163 @@
+import argparse
+import random
+import struct
+import sys
+
+import numpy as np
+
+from classes import STRENGTH
+from batch import best5_batch
+from ranges import STRENGTH_CHARS, SUIT_CHARS
+from parallel import EvaluatorPool
+from utils import ordered_map
+
+# a hand record is (id, board, holes): an integer id, the 5 board card indices & each player's 2 hole card indices.
+# text format, a record per line:   <id> <board> <hole> <hole> ...   e.g. '17 2c7s9dTs3h AhKd QsQc'
+# binary format, a record is a '<QB' header (id, number of players) then a byte per card index, board then holes.
+# results are (id, ranks), a rank (as from evaluate) per player, written as '<id> <rank> <rank> ...' lines or a
+# '<QB' header then a '<H' per rank
+SUIT_LETTERS = {suit: suit_char for suit_char, suit in SUIT_CHARS.items()}
+CARD_TEXT = [STRENGTH_CHARS[STRENGTH[index]] + SUIT_LETTERS[index // 13] for index in range(52)]  # e.g. 'Ah'
+CARD_INDEX = {text: index for index, text in enumerate(CARD_TEXT)}
+RECORD_HEADER = struct.Struct('<QB')
+N_BOARD = 5
+
+"""READING"""
+def parse_cards(text):
+    """card indices of cards written back to back, e.g. 'AhKd'"""
+    return [CARD_INDEX[text[i:i + 2]] for i in range(0, len(text), 2)]
+
+def read_text_records(file):
+    """yields a record per non blank line of a text file, one line in memory at a time"""
+    for line_num, line in enumerate(file, 1):
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            record_id = int(fields[0])
+            board, holes = parse_cards(fields[1]), [parse_cards(field) for field in fields[2:]]
+        except (IndexError, KeyError, ValueError):
+            raise ValueError(f'line {line_num}: can\'t read hand record {line.strip()!r}') from None
+        if len(board) != N_BOARD or not holes or any(len(hole) != 2 for hole in holes):
+            raise ValueError(f'line {line_num}: needs a 5 card board and 2 cards per player')
+        if len(set(board).union(*holes)) != N_BOARD + 2 * len(holes):
+            raise ValueError(f'line {line_num}: has a card more than once')
+        yield record_id, board, holes
+
+def read_binary_records(file):
+    """yields each record of a binary file, reading a record at a time"""
+    while header := file.read(RECORD_HEADER.size):
+        if len(header) < RECORD_HEADER.size:
+            raise ValueError('binary hand records end part way through a header')
+        record_id, n_players = RECORD_HEADER.unpack(header)
+        cards = file.read(N_BOARD + 2 * n_players)
+        if len(cards) < N_BOARD + 2 * n_players:
+            raise ValueError(f'binary hand record {record_id} is cut short')
+        if not n_players:
+            raise ValueError(f'binary hand record {record_id} has no players')
+        if max(cards) >= 52:
+            raise ValueError(f'binary hand record {record_id} has a card byte over 51')
+        if len(set(cards)) != len(cards):
+            raise ValueError(f'binary hand record {record_id} has a card more than once')
+        yield record_id, list(cards[:N_BOARD]), [list(cards[i:i + 2]) for i in range(N_BOARD, len(cards), 2)]
+
+def chunked(records, chunk_size):
+    """groups records into lists of chunk_size (the last can be shorter)"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+"""SCORING"""
+def score_chunk(chunk):
+    """(id, ranks) for each record of a chunk, every player's 7 cards ranked in one best5_batch call"""
+    rows = [hole + board for record_id, board, holes in chunk for hole in holes]
+    ranks = best5_batch(np.array(rows, dtype=np.int64))[0].tolist()
+    results = []
+    start = 0
+    for record_id, board, holes in chunk:
+        results.append((record_id, ranks[start:start + len(holes)]))
+        start += len(holes)
+    return results
+
+def scored_chunks(chunks, executor=None, in_flight=8):
+    """yields score_chunk results for each chunk in order, scored on executor if one's given (see utils.ordered_map)"""
+    return ordered_map(score_chunk, chunks, executor, in_flight)
+
+"""WRITING"""
+def write_text_results(results_chunks, file):
+    """writes each chunk's results as they come, gives the number of records written"""
+    n_records = 0
+    for results in results_chunks:
+        file.write(''.join(f'{record_id} {" ".join(map(str, ranks))}\n' for record_id, ranks in results))
+        n_records += len(results)
+    return n_records
+
+def write_binary_results(results_chunks, file):
+    """binary version of write_text_results"""
+    n_records = 0
+    for results in results_chunks:
+        file.write(b''.join(RECORD_HEADER.pack(record_id, len(ranks)) + struct.pack(f'<{len(ranks)}H', *ranks)
+                            for record_id, ranks in results))
+        n_records += len(results)
+    return n_records
+
+def write_text_records(records, file):
+    for record_id, board, holes in records:
+        file.write(f'{record_id} {"".join(map(CARD_TEXT.__getitem__, board))} '
+                   f'{" ".join("".join(map(CARD_TEXT.__getitem__, hole)) for hole in holes)}\n')
+
+def write_binary_records(records, file):
+    for record_id, board, holes in records:
+        cards = board + [index for hole in holes for index in hole]
+        file.write(RECORD_HEADER.pack(record_id, len(holes)) + bytes(cards))
+
+def random_records(n_records, max_players=6, seed=0):
+    """seeded random showdowns with 2 to max_players players, as records"""
+    rng = random.Random(seed)
+    for record_id in range(n_records):
+        n_players = rng.randint(2, max_players)
+        deal = rng.sample(range(52), N_BOARD + 2 * n_players)
+        yield record_id, deal[:N_BOARD], [deal[i:i + 2] for i in range(N_BOARD, len(deal), 2)]
+
+"""---------------------------------------------------------------------------------------------------------------------"""
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='scores hand records (every player\'s rank at showdown) in chunks, '
+                                                 'streaming from input to output')
+    parser.add_argument('input', nargs='?', default='-', help='hand records file, - for stdin')
+    parser.add_argument('--out', default='-', help='results file, - for stdout')
+    parser.add_argument('--format', choices=('text', 'binary'), default='text', help='of both input & output')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='records evaluated together')
+    parser.add_argument('--workers', type=int, default=0, help='processes to fan chunks out over, 0 for none')
+    parser.add_argument('--generate', type=int, metavar='N', help='write N random hand records to --out instead')
+    args = parser.parse_args(argv)
+
+    binary = args.format == 'binary'
+    mode = 'b' if binary else ''
+    out = (sys.stdout.buffer if binary else sys.stdout) if args.out == '-' else open(args.out, 'w' + mode)
+    try:
+        if args.generate is not None:
+            (write_binary_records if binary else write_text_records)(random_records(args.generate), out)
+            return 0
+        source = (sys.stdin.buffer if binary else sys.stdin) if args.input == '-' else open(args.input, 'r' + mode)
+        with source:
+            chunks = chunked((read_binary_records if binary else read_text_records)(source), args.chunk_size)
+            write = write_binary_results if binary else write_text_results
+            if args.workers:
+                with EvaluatorPool(args.workers) as pool:
+                    n_records = write(scored_chunks(chunks, pool.executor), out)
+            else:
+                n_records = write(scored_chunks(chunks), out)
+        print(f'Scored {n_records} hand records', file=sys.stderr)
+    finally:
+        if out not in (sys.stdout, sys.stdout.buffer):
+            out.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
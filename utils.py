@@ -0,0 +1,30 @@
+from collections import deque
+
+def ordered_map(function, items, executor=None, in_flight=8):
+    """yields function(item) for each item in order. with an executor, keeps up to in_flight items submitted ahead
+    (so memory stays bounded), and whatever's still in flight gets cancelled if the caller stops early"""
+    if executor is None:
+        for item in items:
+            yield function(item)
+        return
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def summarise(latencies, n_items=None):
+    """percentiles in microseconds & throughput (items per second, an item per call unless n_items is given) of a
+    list of latencies"""
+    latencies = sorted(latencies)
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] / 1000
+    total = sum(latencies)
+    return {'calls': len(latencies), 'p50_us': percentile(50), 'p90_us': percentile(90), 'p99_us': percentile(99),
+            'mean_us': total / len(latencies) / 1000, 'throughput_per_s': (n_items or len(latencies)) / total * 1e9}